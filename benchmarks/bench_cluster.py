@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from benchmarks.common import BenchClient, ServerProcess, free_port
+
+# Messages/s through the sharded server for different worker counts. Each
+# sender talks to a partner on its own connection (so most deliveries cross
+# shards over the hub), and load comes from several client processes so the
+# generator itself is not capped by one GIL.
+#
+#   python -m benchmarks.bench_cluster --workers 1 2 4 --client-processes 4
+
+
+async def run_pairs(port, prefix, pairs, duration, window):
+    received = 0
+
+    def on_push(client, frame):
+        nonlocal received
+        if frame.get("action") == "new_message":
+            received += 1
+            client.sender.inflight.release()
+
+    senders = []
+    for i in range(pairs):
+        sender = BenchClient(port)
+        partner = BenchClient(port, on_push=on_push)
+        await sender.connect()
+        await partner.connect()
+        await sender.register_and_login(f"{prefix}s{i}")
+        await partner.register_and_login(f"{prefix}r{i}")
+        reply = await sender.request({"action": "create_chat", "name": f"{prefix}{i}", "members": [f"{prefix}r{i}"]})
+        sender.chat_id = reply["chat_id"]
+        sender.inflight = asyncio.Semaphore(window)
+        sender.partner = partner
+        partner.sender = sender
+        senders.append(sender)
+
+    stop_at = time.perf_counter() + duration
+
+    async def pump(sender):
+        n = 0
+        while time.perf_counter() < stop_at:
+            await sender.inflight.acquire()
+            sender.send({"action": "send_message", "chat_id": sender.chat_id, "message": f"m{n}"})
+            n += 1
+            await sender.writer.drain()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(pump(s) for s in senders))
+    elapsed = time.perf_counter() - started
+    for sender in senders:
+        await sender.close()
+        await sender.partner.close()
+    return received, elapsed
+
+
+def client_process(job):
+    port, prefix, pairs, duration, window = job
+    return asyncio.run(run_pairs(port, prefix, pairs, duration, window))
+
+
+def run_workers(workers, args):
+    port = free_port()
+    with ServerProcess(["-m", "server_app.headless", "--port", str(port), "--workers", str(workers),
+                        "--log-level", "WARNING"], port):
+        time.sleep(1)  # let every shard bind before clients arrive
+        jobs = [(port, f"w{workers}p{i}", args.pairs, args.duration, args.window)
+                for i in range(args.client_processes)]
+        with multiprocessing.get_context("spawn").Pool(args.client_processes) as pool:
+            results = pool.map(client_process, jobs)
+    received = sum(count for count, _ in results)
+    elapsed = max(seconds for _, seconds in results)
+    return {"workers": workers, "messages_per_second": round(received / elapsed, 1), "delivered": received}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded server throughput by worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--pairs", type=int, default=25, help="Sender/receiver pairs per client process")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        result = run_workers(workers, args)
+        print(result)
+        results.append(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import json
+import timeit
+from shared.codec import JSON, MSGPACK
+
+# Encode/decode cost and payload size per codec for typical frames.
+#
+#   python -m benchmarks.bench_codec
+
+
+def sample_frames():
+    message = {
+        "action": "new_message", "chat_id": "3f0f6a4e-8a5e-4c55-9a39-2f1b1f3c0d11",
+        "id": 123456, "timestamp": "2026-10-17 12:00:00", "from": "student42",
+        "message": "See you at the lab at 10, bring the report draft please"
+    }
+    page = {
+        "action": "chat_messages", "chat_id": message["chat_id"], "before_id": None, "after_id": None,
+        "messages": [
+            {"id": 1000 + i, "from": f"student{i % 30}", "message": message["message"],
+             "timestamp": "2026-10-17 12:00:00"}
+            for i in range(50)
+        ],
+        "has_more": True, "next_cursor": {"before_id": 1000},
+    }
+    chats = {"status": "ok", "chats": [{"id": message["chat_id"], "name": f"Chat {i}"} for i in range(40)]}
+    return {"new_message": message, "chat_messages_50": page, "chat_list_40": chats,
+            "chat_removed": {"action": "chat_removed", "chat_id": message["chat_id"], "version": 7}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs msgpack codec microbenchmark")
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name, frame in sample_frames().items():
+        for codec in (JSON, MSGPACK):
+            payload = codec.encode(frame)
+            encode_us = min(timeit.repeat(lambda: codec.encode(frame), number=args.number, repeat=3)) / args.number * 1e6
+            decode_us = min(timeit.repeat(lambda: codec.decode(payload), number=args.number, repeat=3)) / args.number * 1e6
+            result = {"frame": name, "codec": codec.name, "bytes": len(payload),
+                      "encode_us": round(encode_us, 2), "decode_us": round(decode_us, 2)}
+            print(result)
+            results.append(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import json
+import time
+from benchmarks.common import BenchClient, ServerProcess, free_port, proc_status
+
+# Compares the threaded and asyncio server engines:
+#   * idle connections the server holds, with its RSS and thread count
+#   * messages/s of send_message -> new_message round trips
+#
+#   python -m benchmarks.bench_engines --connections 1000 --senders 50
+
+
+async def hold_connections(port, count):
+    held = []
+    for _ in range(count):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            break
+        held.append(writer)
+    return held
+
+
+async def measure_throughput(port, senders, duration, window):
+    received = 0
+
+    def on_push(client, frame):
+        nonlocal received
+        if frame.get("action") == "new_message":
+            received += 1
+            client.inflight.release()
+
+    clients = []
+    for i in range(senders):
+        client = BenchClient(port, on_push=on_push)
+        await client.connect()
+        await client.register_and_login(f"sender{i}")
+        reply = await client.request({"action": "create_chat", "name": f"bench{i}", "members": []})
+        client.chat_id = reply["chat_id"]
+        client.inflight = asyncio.Semaphore(window)
+        clients.append(client)
+
+    stop_at = time.perf_counter() + duration
+
+    async def pump(client):
+        n = 0
+        while time.perf_counter() < stop_at:
+            await client.inflight.acquire()
+            client.send({"action": "send_message", "chat_id": client.chat_id, "message": f"m{n}"})
+            n += 1
+            await client.writer.drain()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(pump(c) for c in clients))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        await client.close()
+    return received / elapsed
+
+
+async def run_engine(engine, args):
+    port = free_port()
+    with ServerProcess(["-m", "server_app.headless", "--engine", engine, "--port", str(port), "--log-level", "WARNING"], port) as server:
+        baseline = proc_status(server.pid)
+        held = await hold_connections(port, args.connections)
+        await asyncio.sleep(1)
+        loaded = proc_status(server.pid)
+        rate = await measure_throughput(port, args.senders, args.duration, args.window)
+        for writer in held:
+            writer.close()
+        return {
+            "engine": engine,
+            "connections_held": len(held),
+            "rss_idle_kb": baseline.get("rss_kb"),
+            "rss_loaded_kb": loaded.get("rss_kb"),
+            "threads_loaded": loaded.get("threads"),
+            "messages_per_second": round(rate, 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded vs asyncio server engine benchmark")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run_engine(engine, args)) for engine in ("threaded", "asyncio")]
+    for result in results:
+        print(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
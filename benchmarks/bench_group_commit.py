@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from shared.config import DB_WRITER_SYNCHRONOUS
+from server_app import python_db
+from server_app.message_writer import MessageWriter
+
+# Messages/s through MessageWriter for several batch settings. Each
+# producer thread behaves like a handler: submit, wait for the commit,
+# repeat. batch_size=1 is the old one-transaction-per-message path.
+#
+#   python -m benchmarks.bench_group_commit --producers 32 --duration 5
+
+DEFAULT_SETTINGS = ["1:0", "8:0.001", "32:0.001", "64:0.002", "256:0.005"]
+
+
+def run_setting(batch_size, max_latency, producers, duration, synchronous):
+    with tempfile.TemporaryDirectory(prefix="messenger-bench-") as workdir:
+        python_db.set_database(os.path.join(workdir, "bench.db"))
+        python_db.init_db()
+        chat_id = python_db.create_chat("bench", [])
+
+        writer = MessageWriter(batch_size=batch_size, max_latency=max_latency, synchronous=synchronous)
+        writer.start()
+        stop_at = time.perf_counter() + duration
+        counts = [0] * producers
+        latencies = []
+
+        def produce(index):
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                writer.write(chat_id, f"user{index}", "hello", python_db.current_timestamp())
+                latencies.append(time.perf_counter() - started)
+                counts[index] += 1
+
+        threads = [threading.Thread(target=produce, args=(i,)) for i in range(producers)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        stats = writer.stats()
+        writer.stop()
+        python_db.pool.close_all()
+
+    latencies.sort()
+    return {
+        "batch_size": batch_size,
+        "max_latency": max_latency,
+        "synchronous": synchronous,
+        "messages_per_second": round(sum(counts) / elapsed, 1),
+        "avg_batch": stats["avg_batch"],
+        "p99_commit_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group-commit message writer benchmark")
+    parser.add_argument("--producers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--settings", nargs="+", default=DEFAULT_SETTINGS,
+                        help="batch_size:max_latency pairs, e.g. 64:0.002")
+    parser.add_argument("--synchronous", default=DB_WRITER_SYNCHRONOUS, choices=["OFF", "NORMAL", "FULL"],
+                        help="PRAGMA synchronous of the writer's connection")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for setting in args.settings:
+        size, latency = setting.split(":")
+        result = run_setting(int(size), float(latency), args.producers, args.duration, args.synchronous)
+        print(result)
+        results.append(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
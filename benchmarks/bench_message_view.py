@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication, QTextEdit
+from client_app.ui.message_view import MessageListView
+
+# Time to render a large chat history and to prepend an older page, for the
+# list view used by the client and for the QTextEdit it replaced.
+#
+#   python -m benchmarks.bench_message_view --messages 50000
+
+
+def sample_lines(count):
+    return [f"[2026-10-17 12:00:00] student{i % 30}: message number {i}, see you at the lab" for i in range(count)]
+
+
+def timed(app, action):
+    started = time.perf_counter()
+    action()
+    app.processEvents()
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def bench_list_view(app, lines, page):
+    view = MessageListView()
+    view.resize(600, 800)
+    view.show()
+    app.processEvents()
+    return {
+        "widget": "MessageListView",
+        "render_ms": timed(app, lambda: view.set_lines(lines)),
+        "append_ms": timed(app, lambda: view.append_lines(lines[:1])),
+        "prepend_page_ms": timed(app, lambda: view.prepend_lines(page)),
+    }
+
+
+def bench_text_edit(app, lines, page):
+    view = QTextEdit()
+    view.setReadOnly(True)
+    view.resize(600, 800)
+    view.show()
+    app.processEvents()
+
+    def render():
+        view.setPlainText("\n".join(lines))
+        view.verticalScrollBar().setValue(view.verticalScrollBar().maximum())
+
+    def prepend():
+        cursor = view.textCursor()
+        cursor.movePosition(cursor.MoveOperation.Start)
+        cursor.insertText("\n".join(page) + "\n")
+
+    return {
+        "widget": "QTextEdit",
+        "render_ms": timed(app, render),
+        "append_ms": timed(app, lambda: view.append(lines[0])),
+        "prepend_page_ms": timed(app, prepend),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client message view rendering benchmark")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--skip-text-edit", action="store_true")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    lines = sample_lines(args.messages)
+    page = sample_lines(args.page_size)
+    results = [bench_list_view(app, lines, page)]
+    if not args.skip_text_edit:
+        results.append(bench_text_edit(app, lines, page))
+    for result in results:
+        result["messages"] = args.messages
+        print(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from shared.config import BUFFER_SIZE, HOST
+from shared.protocol import FrameDecoder, encode_frame
+from shared.codec import CODECS, JSON
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PUSH_ACTIONS = {"new_message", "chat_added", "chat_removed", "chat_renamed", "presence", "message_ack"}
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def proc_status(pid):
+    # VmRSS / Threads from /proc; empty on platforms without procfs.
+    status = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key == "VmRSS":
+                    status["rss_kb"] = int(value.split()[0])
+                elif key == "Threads":
+                    status["threads"] = int(value)
+    except OSError:
+        pass
+    return status
+
+
+class ServerProcess:
+    # Runs a server in a child process with a throwaway working directory,
+    # so the relative DB_NAME resolves to a fresh database.
+    def __init__(self, args, port):
+        self.args = args
+        self.port = port
+        self.workdir = tempfile.TemporaryDirectory(prefix="messenger-bench-")
+        self.proc = None
+
+    def __enter__(self):
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+        self.proc = subprocess.Popen(
+            [sys.executable, *self.args],
+            cwd=self.workdir.name, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.time() + 20
+        while time.time() < deadline:
+            try:
+                socket.create_connection((HOST, self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                if self.proc.poll() is not None:
+                    break
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError(f"Server {self.args} did not come up on port {self.port}")
+
+    def __exit__(self, *exc):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.workdir.cleanup()
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+
+class BenchClient:
+    # Minimal asyncio speaker of the server protocol. Replies are matched in
+    # order; pushed frames (new_message, ...) go to on_push. With
+    # streaming=True every frame goes to on_push.
+    def __init__(self, port, on_push=None):
+        self.port = port
+        self.on_push = on_push
+        self.streaming = False
+        self.codec = JSON
+        self.reader = None
+        self.writer = None
+        self.replies = asyncio.Queue()
+        self.reader_task = None
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(HOST, self.port)
+        self.reader_task = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await self.reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                for frame in decoder.feed(data):
+                    if self.streaming or frame.get("action") in PUSH_ACTIONS:
+                        if self.on_push:
+                            self.on_push(self, frame)
+                    else:
+                        self.replies.put_nowait(frame)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def send(self, message):
+        data = encode_frame(message, self.codec)
+        self.bytes_sent += len(data)
+        self.writer.write(data)
+
+    async def request(self, message, timeout=30):
+        self.send(message)
+        await self.writer.drain()
+        return await asyncio.wait_for(self.replies.get(), timeout)
+
+    async def hello(self, codec_name):
+        reply = await self.request({"action": "hello", "codecs": [codec_name]})
+        self.codec = CODECS[reply["codec"]]
+
+    async def register_and_login(self, keyword, password="bench"):
+        await self.request({"action": "register", "keyword": keyword, "nickname": keyword, "password": password})
+        reply = await self.request({"action": "login", "keyword": keyword, "password": password})
+        if reply.get("status") != "ok":
+            raise RuntimeError(f"Login failed for {keyword}: {reply}")
+
+    async def close(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
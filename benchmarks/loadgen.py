@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+from benchmarks.common import BenchClient, ServerProcess, free_port, percentile, proc_status
+from shared.protocol import encode_frame
+
+# Headless load generator speaking the server protocol. Simulated users
+# register, log in, create chats, post at a fixed rate and fetch history;
+# delivery latency is measured from send to new_message receipt. With
+# --watch every user keeps one of their chats open (presence updates) and
+# --typing-rate adds typing events; bytes_by_action then shows what the
+# presence frames cost next to the messages themselves.
+#
+#   python -m benchmarks.loadgen --users 2000 --chat-size 20 --rate 0.5 \
+#       --duration 30 --output results.json
+#   python -m benchmarks.loadgen --users 500 --watch --typing-rate 0.5
+#
+# Without --port a headless server is started on a fresh database.
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+class LoadStats:
+    def __init__(self):
+        self.sent = 0
+        self.delivered = 0
+        self.latencies = []
+        self.history_fetches = 0
+        self.history_replies = 0
+        self.typing_sent = 0
+        self.errors = 0
+        self.frames_by_action = {}
+        self.bytes_by_action = {}
+
+    def on_frame(self, client, frame):
+        action = frame.get("action") or frame.get("status", "reply")
+        self.frames_by_action[action] = self.frames_by_action.get(action, 0) + 1
+        # Re-encoding gives the exact wire size: both sides use encode_frame.
+        size = len(encode_frame(frame, client.codec))
+        self.bytes_by_action[action] = self.bytes_by_action.get(action, 0) + size
+        if action == "new_message":
+            self.delivered += 1
+            try:
+                sent_at = float(frame["message"].split("|", 1)[0])
+            except (KeyError, ValueError):
+                return
+            self.latencies.append(time.time() - sent_at)
+        elif action == "chat_messages":
+            self.history_replies += 1
+        elif frame.get("status") == "error":
+            self.errors += 1
+
+
+async def setup_users(args, port):
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    run_id = f"{int(time.time())}{random.randint(0, 999):03d}"
+
+    async def make_user(i):
+        async with semaphore:
+            client = BenchClient(port)
+            await client.connect()
+            if args.codec != "json":
+                await client.hello(args.codec)
+            client.keyword = f"load{run_id}_{i}"
+            await client.register_and_login(client.keyword)
+            client.chats = []
+            return client
+
+    return await asyncio.gather(*(make_user(i) for i in range(args.users)))
+
+
+def plan_chats(args, clients):
+    # Every user lands in at least one chat; extra chats get random members.
+    shuffled = random.sample(clients, len(clients))
+    size = min(args.chat_size, len(clients))
+    groups = [shuffled[i:i + size] for i in range(0, len(shuffled), size)]
+    while len(groups) < args.chats:
+        groups.append(random.sample(clients, size))
+    return groups
+
+
+async def setup_chats(args, clients):
+    for index, members in enumerate(plan_chats(args, clients)):
+        creator = members[0]
+        reply = await creator.request({
+            "action": "create_chat",
+            "name": f"load chat {index}",
+            "members": [m.keyword for m in members]
+        })
+        if reply.get("status") != "ok":
+            raise RuntimeError(f"create_chat failed: {reply}")
+        for member in members:
+            member.chats.append(reply["chat_id"])
+    # Let chat_added notifications settle before measuring.
+    await asyncio.sleep(1)
+
+
+def schedule(rate, stop_at):
+    # First event at a random phase so users do not fire in lockstep.
+    if rate <= 0:
+        return stop_at
+    return time.perf_counter() + random.random() / rate
+
+
+async def run_user(client, args, stats, stop_at):
+    if args.watch:
+        client.watched = random.choice(client.chats)
+        client.send({"action": "watch_chat", "chat_id": client.watched})
+    next_send = schedule(args.rate, stop_at)
+    next_fetch = schedule(args.history_rate, stop_at)
+    next_typing = schedule(args.typing_rate, stop_at)
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        if now >= next_send:
+            client.send({
+                "action": "send_message",
+                "chat_id": random.choice(client.chats),
+                "message": f"{time.time()}|{'x' * args.message_size}"
+            })
+            stats.sent += 1
+            next_send += 1.0 / args.rate
+        if now >= next_fetch:
+            client.send({
+                "action": "get_chat_messages",
+                "chat_id": random.choice(client.chats),
+                "limit": args.history_limit
+            })
+            stats.history_fetches += 1
+            next_fetch += 1.0 / args.history_rate
+        if now >= next_typing:
+            client.send({
+                "action": "typing",
+                "chat_id": client.watched if args.watch else random.choice(client.chats)
+            })
+            stats.typing_sent += 1
+            next_typing += 1.0 / args.typing_rate
+        await client.writer.drain()
+        await asyncio.sleep(max(0.0, min(next_send, next_fetch, next_typing, stop_at) - time.perf_counter()))
+
+
+async def run_load(args, port, server_pid):
+    stats = LoadStats()
+    setup_started = time.perf_counter()
+    clients = await setup_users(args, port)
+    await setup_chats(args, clients)
+    setup_seconds = time.perf_counter() - setup_started
+
+    for client in clients:
+        client.on_push = stats.on_frame
+        client.streaming = True
+
+    rss_before = proc_status(server_pid).get("rss_kb") if server_pid else None
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    await asyncio.gather(*(run_user(c, args, stats, stop_at) for c in clients))
+    await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - started
+    server_status = proc_status(server_pid) if server_pid else {}
+
+    bytes_received = sum(c.bytes_received for c in clients)
+    bytes_sent = sum(c.bytes_sent for c in clients)
+    for client in clients:
+        await client.close()
+
+    return {
+        "params": vars(args),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "setup_seconds": round(setup_seconds, 2),
+        "sent": stats.sent,
+        "delivered": stats.delivered,
+        "send_rate": round(stats.sent / args.duration, 1),
+        "delivery_rate": round(stats.delivered / elapsed, 1),
+        "latency_p50_ms": round(percentile(stats.latencies, 50) * 1000, 2),
+        "latency_p99_ms": round(percentile(stats.latencies, 99) * 1000, 2),
+        "history_fetches": stats.history_fetches,
+        "history_replies": stats.history_replies,
+        "typing_sent": stats.typing_sent,
+        "errors": stats.errors,
+        "bytes_received": bytes_received,
+        "bytes_sent": bytes_sent,
+        "frames_by_action": stats.frames_by_action,
+        "bytes_by_action": stats.bytes_by_action,
+        "server_rss_kb_before": rss_before,
+        "server_rss_kb_after": server_status.get("rss_kb"),
+        "server_threads": server_status.get("threads"),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic client load generator")
+    parser.add_argument("--port", type=int, help="Use an already running server on this port")
+    parser.add_argument("--server-pid", type=int, help="PID of that server, for RSS reporting")
+    parser.add_argument("--engine", choices=["asyncio", "threaded"], default="asyncio",
+                        help="Engine of the spawned server")
+    parser.add_argument("--codec", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=0, help="Minimum number of chats (default: users / chat-size)")
+    parser.add_argument("--chat-size", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1.0, help="Messages per second per user")
+    parser.add_argument("--message-size", type=int, default=64)
+    parser.add_argument("--history-rate", type=float, default=0.0, help="History fetches per second per user")
+    parser.add_argument("--history-limit", type=int, default=50)
+    parser.add_argument("--watch", action="store_true", help="Each user keeps one chat open for presence updates")
+    parser.add_argument("--typing-rate", type=float, default=0.0, help="Typing events per second per user")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--drain", type=float, default=2.0, help="Seconds to wait for deliveries after sending stops")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--output", help="Append the result as a JSON line to this file")
+    return parser.parse_args(argv)
+
+
+def server_args(args, port):
+    return ["-m", "server_app.headless", "--engine", args.engine, "--port", str(port), "--log-level", "WARNING"]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    raise_fd_limit()
+    if args.port:
+        result = asyncio.run(run_load(args, args.port, args.server_pid))
+    else:
+        port = free_port()
+        with ServerProcess(server_args(args, port), port) as server:
+            result = asyncio.run(run_load(args, port, server.pid))
+
+    print(json.dumps({k: v for k, v in result.items() if k != "params"}, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
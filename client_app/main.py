@@ -1,11 +1,18 @@
 import sys
 import socket
 import threading
-import json
+import time
+import uuid
 from PyQt6.QtWidgets import QApplication, QMessageBox
 from PyQt6.QtCore import Qt, QObject, pyqtSignal
 from .ui.client_ui import ClientUI
-from shared.config import HOST, PORT, BUFFER_SIZE, ENCODING
+from .message_cache import MessageCache
+from .request_tracker import RequestTracker
+from shared.config import (
+    HOST, PORT, BUFFER_SIZE, HISTORY_PAGE_SIZE, SEARCH_PAGE_SIZE, TYPING_MIN_INTERVAL, RESUME_MAX_CHATS, CLIENT_CACHE_DIR
+)
+from shared.protocol import FrameDecoder, FrameError, decode_payload, send_frame
+from shared.codec import CODECS, JSON, SUPPORTED_CODECS
 
 
 class ResponseHandler(QObject):
@@ -20,25 +27,75 @@ class ClientApp:
         self.ui.login_button.clicked.connect(self.login)
         self.ui.register_button.clicked.connect(self.register)
         self.ui.send_button.clicked.connect(self.send_message)
+        self.ui.message_input.textEdited.connect(self.on_message_edited)
         self.ui.create_chat_button.clicked.connect(self.create_chat)
 
         self.ui.chat_list_widget.currentItemChanged.connect(self.change_chat)
+        self.ui.chat_messages.older_requested.connect(self.load_older_messages)
         self.ui.add_users_button.clicked.connect(self.add_users_to_chat)
+        self.ui.rename_chat_button.clicked.connect(self.rename_chat)
         self.ui.leave_chat_button.clicked.connect(self.leave_chat)
         self.ui.delete_chat_button.clicked.connect(self.delete_chat)
+        self.ui.search_button.clicked.connect(self.search_messages)
+        self.ui.search_input.returnPressed.connect(self.search_messages)
+        self.ui.search_more_button.clicked.connect(self.load_more_search_results)
+        self.ui.search_results.itemActivated.connect(self.open_search_result)
 
         self.current_chat_id = None
+        self.oldest_message_id = None
+        self.has_older_messages = False
+        self.loading_older = False
+        self.shown_message_ids = set()
         self.keyword = None
         self.nickname = None
+        self.credentials = None  # (keyword, password) for logging in again after a reconnect
+        self.resuming = False
+
+        # Delivery tracking: the highest seq seen per chat whose history is
+        # contiguous up to it (what resume asks the server to continue
+        # from), and sent messages the server has not acknowledged yet,
+        # resent with the same client_msg_id after a reconnect.
+        self.last_seq = {}
+        self.unacked = {}
+
+        # Local history cache. A chat is "synced" once this session has
+        # fetched everything after the cached range; from then on live
+        # messages are cached too. Live messages arriving while the sync is
+        # in flight are held back until it completes.
+        self.cache = None
+        self.synced_chats = set()
+        self.pending_live_messages = {}
+
+        # Chat list sync: version of the list shown, and deltas received
+        # while a full get_chats is in flight.
+        self.chat_list_version = None
+        self.chat_list_syncing = False
+        self.pending_chat_events = []
+
+        # Search: the query whose results are listed and where the next
+        # page starts (None when there are no more results).
+        self.search_query = None
+        self.search_next_offset = None
+
+        # Presence of the open chat: members online, others typing, and
+        # when this client last told the server it is typing.
+        self.presence_online = set()
+        self.presence_typing = []
+        self.last_typing_sent = 0.0
 
         self.response_handler = ResponseHandler()
         self.response_handler.response_received.connect(self.handle_response)
+        # Requests that expect a reply go through here; the reply comes back
+        # to the callback given with the request.
+        self.requests = RequestTracker(self.send, self.show_error)
 
         self.connection_lost_shown = False
+        self.codec = JSON
 
         try:
             self.socket.connect((HOST, PORT))
             threading.Thread(target=self.receive_messages, daemon=True).start()
+            self.send_hello()
             self.ui.append_log(f"Connected to server {HOST}:{PORT}")
         except Exception as e:
             if hasattr(e, 'winerror') and e.winerror == 10061:
@@ -58,11 +115,12 @@ class ClientApp:
             QMessageBox.warning(self.ui, "Input Error", "Keyword and password required")
             return
 
-        self.send({
+        self.credentials = (keyword, password)
+        self.requests.request({
             "action": "login",
             "keyword": keyword,
             "password": password
-        })
+        }, self.on_logged_in)
 
     def register(self):
         keyword = self.ui.keyword_input.text().strip()
@@ -73,12 +131,12 @@ class ClientApp:
             QMessageBox.warning(self.ui, "Input Error", "Keyword, nickname, and password required")
             return
 
-        self.send({
+        self.requests.request({
             "action": "register",
             "keyword": keyword,
             "nickname": nickname,
             "password": password
-        })
+        }, self.log_success)
 
     def send_message(self):
         message = self.ui.message_input.text().strip()
@@ -88,12 +146,44 @@ class ClientApp:
             QMessageBox.warning(self.ui, "No Chat Selected", "Select a chat first")
             return
 
-        self.send({
+        request = {
             "action": "send_message",
             "chat_id": self.current_chat_id,
-            "message": message
-        })
+            "message": message,
+            "client_msg_id": uuid.uuid4().hex
+        }
+        self.unacked[request["client_msg_id"]] = request
+        self.send_chat_message(request)
         self.ui.message_input.clear()
+        self.last_typing_sent = 0.0  # The server clears our indicator on send
+
+    def send_chat_message(self, request):
+        # A message that times out (or is cut off by a disconnect) stays
+        # unacknowledged and is resent, with the same client_msg_id, after a
+        # reconnect. One the server refuses is dropped: resending would only
+        # be refused again.
+        client_msg_id = request["client_msg_id"]
+        self.requests.request(
+            request, self.handle_message_ack,
+            lambda message: self.handle_message_rejected(client_msg_id, message),
+            on_timeout=self.log_error)
+
+    def handle_message_ack(self, response):
+        self.unacked.pop(response.get("client_msg_id"), None)
+
+    def handle_message_rejected(self, client_msg_id, message):
+        self.unacked.pop(client_msg_id, None)
+        self.show_error(f"Message not sent: {message}")
+
+    def on_message_edited(self, text):
+        # At most one typing event per TYPING_MIN_INTERVAL; the server keeps
+        # the indicator up a little longer than that between refreshes.
+        if not text or not self.current_chat_id:
+            return
+        now = time.monotonic()
+        if now - self.last_typing_sent >= TYPING_MIN_INTERVAL:
+            self.last_typing_sent = now
+            self.send({"action": "typing", "chat_id": self.current_chat_id})
 
     def create_chat(self):
         name = self.ui.chat_name_input.text().strip()
@@ -104,21 +194,169 @@ class ClientApp:
             QMessageBox.warning(self.ui, "Input Error", "Chat name required")
             return
 
-        self.send({
+        self.requests.request({
             "action": "create_chat",
             "name": name,
             "members": members
-        })
+        }, lambda response: self.ui.append_log(f"Chat created with id {response['chat_id']}"))
 
 
     def change_chat(self, current, previous=None):
-        if current:
-            self.current_chat_id = current.data(Qt.ItemDataRole.UserRole)
-            self.ui.chat_messages.clear()
-            self.request_chat_messages(self.current_chat_id)
-        else:
+        # Pages still on their way for the chat being left are no longer
+        # wanted; it resyncs on its next visit. Other chats' syncs (resume
+        # rounds) carry on.
+        if self.current_chat_id:
+            self.requests.cancel_tag(f"history:{self.current_chat_id}")
+        self.oldest_message_id = None
+        self.has_older_messages = False
+        self.loading_older = False
+        self.shown_message_ids = set()
+        self.presence_online = set()
+        self.presence_typing = []
+        self.last_typing_sent = 0.0
+        self.ui.set_presence_text("")
+        if not current:
             self.current_chat_id = None
             self.ui.chat_messages.clear()
+            self.send({"action": "watch_chat", "chat_id": None})
+            return
+
+        chat_id = current.data(Qt.ItemDataRole.UserRole)
+        self.current_chat_id = chat_id
+        self.requests.request({"action": "watch_chat", "chat_id": chat_id}, self.handle_presence, self.log_error)
+        cached = self.cache.latest(chat_id, HISTORY_PAGE_SIZE) if self.cache else []
+        self.show_messages(cached)
+        if not cached:
+            self.start_chat_sync(chat_id)
+            self.request_chat_messages(chat_id)
+            return
+
+        self.oldest_message_id = cached[0]["id"]
+        self.has_older_messages = len(cached) == HISTORY_PAGE_SIZE or not self.cache.reached_start(chat_id)
+        if chat_id not in self.synced_chats:
+            # Only ask for what was posted after the newest cached message.
+            self.start_chat_sync(chat_id)
+            self.request_chat_messages(chat_id, after_id=self.cache.last_id(chat_id))
+
+    def load_older_messages(self):
+        if not self.current_chat_id or not self.has_older_messages or self.loading_older:
+            return
+        chat_id = self.current_chat_id
+        if self.cache:
+            cached = self.cache.before(chat_id, self.oldest_message_id, HISTORY_PAGE_SIZE)
+            if len(cached) == HISTORY_PAGE_SIZE or self.cache.reached_start(chat_id):
+                self.prepend_messages(cached)
+                self.has_older_messages = len(cached) == HISTORY_PAGE_SIZE
+                return
+        self.loading_older = True
+        self.request_chat_messages(chat_id, before_id=self.oldest_message_id)
+
+    def start_chat_sync(self, chat_id):
+        self.pending_live_messages.setdefault(chat_id, [])
+
+    def finish_chat_sync(self, chat_id):
+        self.synced_chats.add(chat_id)
+        held = self.pending_live_messages.pop(chat_id, [])
+        if self.cache and held:
+            self.cache.store(chat_id, held)
+        self.note_seq(chat_id, held)
+        return held
+
+    def note_seq(self, chat_id, messages):
+        seqs = [msg["seq"] for msg in messages if msg.get("seq") is not None]
+        if seqs and max(seqs) > self.last_seq.get(chat_id, 0):
+            self.last_seq[chat_id] = max(seqs)
+
+    def handle_live_message(self, message):
+        chat_id = message.get("chat_id")
+        if chat_id in self.synced_chats:
+            last = self.last_seq.get(chat_id)
+            seq = message.get("seq")
+            if last is not None and seq is not None and seq > last + 1:
+                # Messages in between never arrived (e.g. dropped while this
+                # connection was slow): fetch them before showing this one.
+                self.synced_chats.discard(chat_id)
+                self.start_chat_sync(chat_id)
+                self.pending_live_messages[chat_id].append(message)
+                self.request_resume({chat_id: last})
+                return
+            if self.cache:
+                self.cache.store(chat_id, [message])
+            self.note_seq(chat_id, [message])
+        elif chat_id in self.pending_live_messages:
+            # Shown once the sync reply is in, so the order stays right.
+            self.pending_live_messages[chat_id].append(message)
+            return
+        if chat_id == self.current_chat_id:
+            self.append_messages([message])
+
+    def handle_resumed(self, response):
+        # The server caps the size of a reply; chats with has_more carry on
+        # from their new last seq in another resume.
+        unfinished = {}
+        for chat in response.get("chats", []):
+            chat_id = chat["chat_id"]
+            messages = chat.get("messages", [])
+            if self.cache and messages:
+                self.cache.store(chat_id, messages)
+            self.note_seq(chat_id, messages)
+            if chat_id == self.current_chat_id:
+                self.append_messages(messages)
+            if chat.get("has_more"):
+                unfinished[chat_id] = self.last_seq.get(chat_id, 0)
+            else:
+                held = self.finish_chat_sync(chat_id)
+                if chat_id == self.current_chat_id:
+                    self.append_messages(held)
+        if unfinished:
+            self.request_resume(unfinished)
+
+    def request_resume(self, chats):
+        # The server looks at no more than RESUME_MAX_CHATS chats per request.
+        items = list(chats.items())
+        for start in range(0, len(items), RESUME_MAX_CHATS):
+            self.requests.request(
+                {"action": "resume", "chats": dict(items[start:start + RESUME_MAX_CHATS])},
+                self.handle_resumed, self.log_error
+            )
+
+    def resume_session(self):
+        # Logged in again after a reconnect: catch up on the chats seen this
+        # session from their last seq, resend what was never acknowledged
+        # and refresh the chat list.
+        self.resuming = False
+        # last_seq also knows chats from the cache that were not opened this
+        # session; those sync when they are opened.
+        chats = {
+            chat_id: seq for chat_id, seq in self.last_seq.items()
+            if chat_id in self.synced_chats or chat_id in self.pending_live_messages
+        }
+        if chats:
+            for chat_id in chats:
+                self.start_chat_sync(chat_id)
+            self.request_resume(chats)
+        for request in list(self.unacked.values()):
+            self.send_chat_message(request)
+        self.request_chats()
+
+    def format_message(self, msg):
+        return f"@{msg['from']}: {msg['message']}"
+
+    def show_messages(self, messages):
+        self.shown_message_ids = {msg["id"] for msg in messages}
+        self.ui.set_chat_messages([self.format_message(msg) for msg in messages])
+
+    def append_messages(self, messages):
+        fresh = [msg for msg in messages if msg.get("id") not in self.shown_message_ids]
+        self.shown_message_ids.update(msg.get("id") for msg in fresh)
+        self.ui.append_chat_messages([self.format_message(msg) for msg in fresh])
+
+    def prepend_messages(self, messages):
+        fresh = [msg for msg in messages if msg["id"] not in self.shown_message_ids]
+        if fresh:
+            self.oldest_message_id = fresh[0]["id"]
+        self.shown_message_ids.update(msg["id"] for msg in fresh)
+        self.ui.prepend_chat_messages([self.format_message(msg) for msg in fresh])
 
     def add_users_to_chat(self):
         if not self.current_chat_id:
@@ -131,56 +369,149 @@ class ClientApp:
             return
 
         users = [u.strip() for u in users_text.split(",") if u.strip()]
-        self.send({
+        self.requests.request({
             "action": "add_users_to_chat",
             "chat_id": self.current_chat_id,
             "users": users
-        })
+        }, self.handle_users_added)
         self.ui.add_users_input.clear()
 
+    def handle_users_added(self, response):
+        results = response.get("results", {})
+        unknown = [keyword for keyword, result in results.items() if result == "unknown_user"]
+        added = [keyword for keyword, result in results.items() if result == "added"]
+        self.ui.append_log(f"Added to chat: {', '.join(added) or 'nobody'}")
+        if unknown:
+            self.show_error(f"Unknown users: {', '.join(unknown)}")
+
+    def rename_chat(self):
+        if not self.current_chat_id:
+            QMessageBox.warning(self.ui, "No Chat Selected", "Select a chat first")
+            return
+
+        name = self.ui.rename_chat_input.text().strip()
+        if not name:
+            QMessageBox.warning(self.ui, "Input Error", "Enter a new chat name")
+            return
+
+        self.requests.request({
+            "action": "rename_chat",
+            "chat_id": self.current_chat_id,
+            "name": name
+        }, self.log_success)
+        self.ui.rename_chat_input.clear()
+
     def leave_chat(self):
         if not self.current_chat_id:
             QMessageBox.warning(self.ui, "No Chat Selected", "Select a chat first")
             return
-        self.send({
+        self.requests.request({
             "action": "leave_chat",
             "chat_id": self.current_chat_id
-        })
+        }, self.log_success)
 
     def delete_chat(self):
         if not self.current_chat_id:
             QMessageBox.warning(self.ui, "No Chat Selected", "Select a chat first")
             return
-        self.send({
+        self.requests.request({
             "action": "delete_chat",
             "chat_id": self.current_chat_id
-        })
+        }, self.log_success)
 
-    def request_chat_messages(self, chat_id):
-        self.send({
+    def search_messages(self):
+        query = self.ui.search_input.text().strip()
+        if not query:
+            return
+        self.requests.cancel_tag("search")
+        self.search_query = query
+        self.search_next_offset = None
+        self.ui.search_results.clear()
+        self.ui.search_more_button.setEnabled(False)
+        self.request_search_results(query, 0)
+
+    def load_more_search_results(self):
+        if self.search_query and self.search_next_offset is not None:
+            self.ui.search_more_button.setEnabled(False)
+            self.request_search_results(self.search_query, self.search_next_offset)
+
+    def request_search_results(self, query, offset):
+        self.requests.request({
+            "action": "search_messages",
+            "query": query,
+            "offset": offset,
+            "limit": SEARCH_PAGE_SIZE
+        }, self.handle_search_results, tag="search")
+
+    def handle_search_results(self, response):
+        if response.get("query") != self.search_query:
+            return  # Results for a search the user has since replaced
+        results = []
+        for result in response.get("results", []):
+            item = self.ui.find_chat_item(result["chat_id"])
+            chat_name = item.text() if item is not None else "?"
+            results.append((f"[{chat_name}] @{result['from']}: {result['snippet']}", result["chat_id"]))
+        self.ui.append_search_results(results)
+        self.search_next_offset = response.get("next_offset")
+        self.ui.search_more_button.setEnabled(self.search_next_offset is not None)
+        if not response.get("offset") and not results:
+            self.ui.append_log(f"No messages found for '{self.search_query}'")
+
+    def open_search_result(self, result_item):
+        item = self.ui.find_chat_item(result_item.data(Qt.ItemDataRole.UserRole))
+        if item is not None:
+            self.ui.chat_list_widget.setCurrentItem(item)
+
+    def request_chat_messages(self, chat_id, before_id=None, after_id=None):
+        request = {
             "action": "get_chat_messages",
-            "chat_id": chat_id
-        })
+            "chat_id": chat_id,
+            "limit": HISTORY_PAGE_SIZE
+        }
+        if before_id is not None:
+            request["before_id"] = before_id
+        if after_id is not None:
+            request["after_id"] = after_id
+        self.requests.request(request, self.handle_chat_messages, self.history_failed, tag=f"history:{chat_id}")
+
+    def history_failed(self, message):
+        self.loading_older = False
+        self.log_error(message)
+
+    def send_hello(self):
+        # Requests go out as JSON until the server confirms a codec.
+        self.codec = JSON
+        self.requests.request({"action": "hello", "codecs": SUPPORTED_CODECS}, self.handle_hello)
+
+    def handle_hello(self, response):
+        self.codec = CODECS.get(response.get("codec"), JSON)
 
     def send(self, data_dict):
         try:
-            data = json.dumps(data_dict)
-            self.socket.sendall(data.encode(ENCODING))
+            send_frame(self.socket, data_dict, self.codec)
         except Exception as e:
             self.ui.append_log(f"Send Error: {e}")
             QMessageBox.critical(self.ui, "Send Error", f"Failed to send data: {e}")
 
     def receive_messages(self):
+        decoder = FrameDecoder()
         try:
             while True:
                 try:
-                    data = self.socket.recv(BUFFER_SIZE).decode(ENCODING)
+                    data = self.socket.recv(BUFFER_SIZE)
                     if not data:
                         raise ConnectionResetError("Server closed the connection.")
-                    response = json.loads(data)
-                    self.response_handler.response_received.emit(response)
-                except json.JSONDecodeError:
-                    self.ui.append_log("Received invalid data from server.")
+                    try:
+                        payloads = decoder.feed_payloads(data)
+                    except FrameError as e:
+                        raise ConnectionResetError(f"Broken stream from server: {e}")
+                    for payload in payloads:
+                        try:
+                            response = decode_payload(payload)
+                        except ValueError:
+                            self.ui.append_log("Received invalid data from server.")
+                            continue
+                        self.response_handler.response_received.emit(response)
                 except (ConnectionResetError, ConnectionAbortedError):
                     raise  # Let outer loop handle it
         except (OSError, ConnectionResetError, ConnectionAbortedError) as e:
@@ -196,65 +527,179 @@ class ClientApp:
 
 
     def handle_response(self, response):
-        status = response.get("status")
-        if status == "error":
+        # Replies carry the request_id of their request; replies to
+        # cancelled or timed out requests are dropped.
+        if "request_id" in response:
+            self.requests.resolve(response)
+            return
+
+        if response.get("status") == "error":
             error_msg = response.get("message", "Unknown error")
-            
+
             if "connection" in error_msg.lower() and not self.connection_lost_shown:
                 self.ui.append_log("⚠️ Server connection lost.")
                 QMessageBox.warning(self.ui, "Disconnected", error_msg)
                 self.disable_ui_on_disconnect()
+                self.requests.cancel_all()
 
                 self.ui.reconnect_button.setEnabled(True)
                 self.connection_lost_shown = True
             else:
-                self.ui.append_log(f"Error: {error_msg}")
-                QMessageBox.warning(self.ui, "Operation Failed", error_msg)
+                self.show_error(error_msg)
             return
 
         action = response.get("action", "")
 
         if action == "new_message":
-            chat_id = response.get("chat_id")
-            sender = response.get("from")
-            message = response.get("message")
-            if chat_id == self.current_chat_id:
-                self.ui.append_chat_message(f"@{sender}: {message}")
+            self.handle_live_message(response)
 
-        elif action == "chat_messages":
-            messages = response.get("messages", [])
-            self.ui.chat_messages.clear()
-            for msg in messages:
-                self.ui.append_chat_message(f"@{msg['from']}: {msg['message']}")
+        elif action == "presence":
+            self.handle_presence(response)
 
-        elif action == "chat_list_updated":
-            self.ui.append_log("Chat list updated")
-            self.request_chats()
+        elif action in ("chat_added", "chat_removed", "chat_renamed"):
+            self.handle_chat_list_event(response)
 
-        elif "nickname" in response:
-            self.nickname = response["nickname"]
-            self.ui.append_log(f"Logged in as {self.nickname}")
-            self.keyword = self.ui.keyword_input.text().strip()
-            self.request_chats()
+    def show_error(self, message):
+        self.ui.append_log(f"Error: {message}")
+        QMessageBox.warning(self.ui, "Operation Failed", message)
 
-        elif "chats" in response:
-            self.ui.chat_list_widget.clear()
-            for chat in response["chats"]:
-                item = self.ui.create_chat_list_item(chat["name"], chat["id"])
-                self.ui.chat_list_widget.addItem(item)
-            self.ui.append_log("Chats updated")
+    def log_error(self, message):
+        self.ui.append_log(f"Error: {message}")
 
-        elif "chat_id" in response:
-            self.ui.append_log(f"Chat created with id {response['chat_id']}")
-            self.request_chats()
+    def log_success(self, response):
+        self.ui.append_log("Operation succeeded")
 
-        elif status == "ok":
-            self.ui.append_log("Operation succeeded")
+    def on_logged_in(self, response):
+        self.nickname = response["nickname"]
+        self.ui.append_log(f"Logged in as {self.nickname}")
+        if self.resuming:
+            self.resume_session()
+            return
+        self.keyword = self.credentials[0]
+        self.open_cache()
+        self.request_chats()
+
+    def relogin_failed(self, message):
+        self.resuming = False
+        self.show_error(message)
+
+    def handle_chat_list(self, response):
+        selected = self.current_chat_id
+        self.ui.chat_list_widget.clear()
+        for chat in response["chats"]:
+            item = self.ui.create_chat_list_item(chat["name"], chat["id"])
+            self.ui.chat_list_widget.addItem(item)
+        # Keep the open chat open (e.g. after a reconnect) if it is still listed.
+        item = self.ui.find_chat_item(selected) if selected else None
+        if item is not None:
+            self.ui.chat_list_widget.setCurrentItem(item)
+        self.ui.append_log("Chats updated")
+        self.chat_list_version = response.get("version")
+        self.chat_list_syncing = False
+        pending, self.pending_chat_events = self.pending_chat_events, []
+        for event in pending:
+            self.handle_chat_list_event(event)
+
+    def handle_chat_messages(self, response):
+        chat_id = response.get("chat_id")
+        messages = response.get("messages", [])
+        has_more = response.get("has_more", False)
+        # Every page we request is adjacent to the cached range, so it can
+        # always be cached, even if the user has switched chats since.
+        if self.cache and messages:
+            self.cache.store(chat_id, messages)
+
+        if response.get("before_id") is not None:
+            if self.cache and not has_more:
+                self.cache.mark_reached_start(chat_id)
+            if chat_id != self.current_chat_id:
+                return
+            self.loading_older = False
+            self.prepend_messages(messages)
+            self.has_older_messages = has_more
+        elif response.get("after_id") is not None:
+            self.note_seq(chat_id, messages)
+            if chat_id == self.current_chat_id:
+                self.append_messages(messages)
+            if has_more and messages and chat_id == self.current_chat_id:
+                self.request_chat_messages(chat_id, after_id=messages[-1]["id"])
+            elif not has_more:
+                held = self.finish_chat_sync(chat_id)
+                if chat_id == self.current_chat_id:
+                    self.append_messages(held)
+            else:
+                self.pending_live_messages.pop(chat_id, None)  # Resume on next visit
+        else:
+            if self.cache and not has_more:
+                self.cache.mark_reached_start(chat_id)
+            self.note_seq(chat_id, messages)
+            held = self.finish_chat_sync(chat_id)
+            if chat_id != self.current_chat_id:
+                return  # Reply for a chat we already switched away from
+            self.show_messages(messages)
+            self.append_messages(held)  # Live messages that beat the reply
+            if messages:
+                self.oldest_message_id = messages[0]["id"]
+            self.has_older_messages = has_more
+
+    def handle_presence(self, response):
+        # A snapshot answers watch_chat; later frames carry only changes.
+        if response.get("chat_id") != self.current_chat_id:
+            return
+        if response.get("snapshot"):
+            self.presence_online = set(response.get("online", []))
+        else:
+            self.presence_online.update(response.get("online", []))
+            self.presence_online.difference_update(response.get("offline", []))
+        if "typing" in response:
+            self.presence_typing = [k for k in response["typing"] if k != self.keyword]
+        self.show_presence()
+
+    def show_presence(self):
+        text = f"{len(self.presence_online)} online"
+        typing = self.presence_typing
+        if len(typing) == 1:
+            text += f" · @{typing[0]} is typing..."
+        elif len(typing) <= 3 and typing:
+            text += f" · {', '.join('@' + k for k in typing)} are typing..."
+        elif typing:
+            text += f" · {len(typing)} people are typing..."
+        self.ui.set_presence_text(text)
+
+    def handle_chat_list_event(self, event):
+        if self.chat_list_syncing or self.chat_list_version is None:
+            self.pending_chat_events.append(event)
+            return
 
-        if action in ("delete_chat", "leave_chat"):
-            self.current_chat_id = None
+        version = event.get("version", 0)
+        if version <= self.chat_list_version:
+            return  # Already part of the list we have
+        if version != self.chat_list_version + 1:
+            self.ui.append_log("Chat list out of sync, reloading")
             self.request_chats()
-            self.ui.chat_messages.clear()
+            return
+        self.chat_list_version = version
+
+        action = event["action"]
+        if action == "chat_added":
+            chat = event["chat"]
+            if self.ui.find_chat_item(chat["id"]) is None:
+                self.ui.chat_list_widget.addItem(self.ui.create_chat_list_item(chat["name"], chat["id"]))
+        elif action == "chat_removed":
+            item = self.ui.find_chat_item(event["chat_id"])
+            if item is not None:
+                row = self.ui.chat_list_widget.row(item)
+                self.ui.chat_list_widget.takeItem(row)
+            if self.cache:
+                self.cache.forget_chat(event["chat_id"])
+            self.synced_chats.discard(event["chat_id"])
+            if event["chat_id"] == self.current_chat_id:
+                self.current_chat_id = None
+                self.ui.chat_messages.clear()
+        elif action == "chat_renamed":
+            item = self.ui.find_chat_item(event["chat_id"])
+            if item is not None:
+                item.setText(event["name"])
 
     def disable_ui_on_disconnect(self):
         self.ui.login_button.setEnabled(False)
@@ -262,8 +707,10 @@ class ClientApp:
         self.ui.send_button.setEnabled(False)
         self.ui.create_chat_button.setEnabled(False)
         self.ui.add_users_button.setEnabled(False)
+        self.ui.rename_chat_button.setEnabled(False)
         self.ui.leave_chat_button.setEnabled(False)
         self.ui.delete_chat_button.setEnabled(False)
+        self.ui.search_button.setEnabled(False)
         self.ui.append_log("All actions disabled due to disconnection.")
 
     def enable_ui_after_reconnect(self):
@@ -272,8 +719,10 @@ class ClientApp:
         self.ui.send_button.setEnabled(True)
         self.ui.create_chat_button.setEnabled(True)
         self.ui.add_users_button.setEnabled(True)
+        self.ui.rename_chat_button.setEnabled(True)
         self.ui.leave_chat_button.setEnabled(True)
         self.ui.delete_chat_button.setEnabled(True)
+        self.ui.search_button.setEnabled(True)
 
     def try_reconnect(self):
         try:
@@ -288,10 +737,24 @@ class ClientApp:
             # Try to connect
             self.socket.connect((HOST, PORT))
             threading.Thread(target=self.receive_messages, daemon=True).start()
+            self.send_hello()
 
             self.ui.append_log(f"Reconnected to server {HOST}:{PORT}")
             QMessageBox.information(self.ui, "Reconnected", "Successfully reconnected to the server.")
 
+            # Messages may have been missed while offline: chats seen this
+            # session catch up from their last seq once logged in again,
+            # the rest resync on their next visit.
+            self.synced_chats.clear()
+            self.pending_live_messages.clear()
+            if self.credentials and self.keyword:
+                self.resuming = True
+                keyword, password = self.credentials
+                self.requests.request(
+                    {"action": "login", "keyword": keyword, "password": password},
+                    self.on_logged_in, self.relogin_failed
+                )
+
             self.enable_ui_after_reconnect()
             self.ui.reconnect_button.setEnabled(False)
             self.connection_lost_shown = False
@@ -304,10 +767,29 @@ class ClientApp:
             self.ui.append_log(f"Reconnect failed: {msg}")
             QMessageBox.critical(self.ui, "Reconnect Failed", f"Could not reconnect: {msg}")
 
+    def open_cache(self):
+        if self.cache:
+            self.cache.close()
+        self.synced_chats.clear()
+        self.pending_live_messages.clear()
+        self.last_seq.clear()
+        self.unacked.clear()
+        try:
+            self.cache = MessageCache.for_account(CLIENT_CACHE_DIR, HOST, PORT, self.keyword)
+        except Exception as e:
+            self.cache = None
+            self.ui.append_log(f"Message cache disabled: {e}")
+            return
+        # Where each cached chat stood, so a gap after the next sync shows.
+        self.last_seq.update(self.cache.last_seqs())
+
     def request_chats(self):
-        self.send({"action": "get_chats"})
+        self.chat_list_syncing = True
+        self.requests.request({"action": "get_chats"}, self.handle_chat_list)
 
     def close_connection(self):
+        if self.cache:
+            self.cache.close()
         try:
             self.socket.shutdown(socket.SHUT_RDWR)
             self.socket.close()
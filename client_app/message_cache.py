@@ -0,0 +1,103 @@
+import os
+import re
+import sqlite3
+
+
+class MessageCache:
+    # Local copy of chat history, one SQLite file per account. For every
+    # chat the cached messages form one contiguous id range: only the
+    # newest page, pages adjacent to the range, and live messages of chats
+    # already synced this session are stored. `reached_start` records that
+    # the range goes back to the first message of the chat. Messages keep
+    # their per-chat seq, so after a restart the client still knows where
+    # each chat's history stands.
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                chat_id TEXT,
+                id INTEGER,
+                sender TEXT,
+                content TEXT,
+                timestamp TEXT,
+                seq INTEGER,
+                PRIMARY KEY (chat_id, id)
+            ) WITHOUT ROWID
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(messages)")]
+        if "seq" not in columns:
+            # Cache files from before seq numbers; their rows keep NULL.
+            self.conn.execute("ALTER TABLE messages ADD COLUMN seq INTEGER")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id TEXT PRIMARY KEY,
+                reached_start INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.commit()
+
+    @classmethod
+    def for_account(cls, cache_dir, host, port, keyword):
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{keyword}@{host}_{port}")
+        return cls(os.path.join(cache_dir, f"{safe}.db"))
+
+    def store(self, chat_id, messages):
+        # messages: dicts as sent by the server (id, seq, from, message, timestamp)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO messages (chat_id, id, sender, content, timestamp, seq) VALUES (?, ?, ?, ?, ?, ?)",
+                [(chat_id, m["id"], m["from"], m["message"], m.get("timestamp"), m.get("seq")) for m in messages]
+            )
+
+    def mark_reached_start(self, chat_id):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO chats (chat_id, reached_start) VALUES (?, 1) "
+                "ON CONFLICT (chat_id) DO UPDATE SET reached_start = 1",
+                (chat_id,)
+            )
+
+    def reached_start(self, chat_id):
+        row = self.conn.execute("SELECT reached_start FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return bool(row and row[0])
+
+    def last_id(self, chat_id):
+        row = self.conn.execute("SELECT MAX(id) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0]
+
+    def last_seqs(self):
+        # {chat_id: highest cached seq} for the chats that have one.
+        cur = self.conn.execute("SELECT chat_id, MAX(seq) FROM messages WHERE seq IS NOT NULL GROUP BY chat_id")
+        return dict(cur.fetchall())
+
+    def latest(self, chat_id, limit):
+        cur = self.conn.execute(
+            "SELECT id, sender, content, timestamp, seq FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+            (chat_id, limit)
+        )
+        return self._as_messages(cur.fetchall()[::-1])
+
+    def before(self, chat_id, before_id, limit):
+        cur = self.conn.execute(
+            "SELECT id, sender, content, timestamp, seq FROM messages WHERE chat_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (chat_id, before_id, limit)
+        )
+        return self._as_messages(cur.fetchall()[::-1])
+
+    def forget_chat(self, chat_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self.conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _as_messages(rows):
+        return [
+            {"id": mid, "seq": seq, "from": sender, "message": content, "timestamp": ts}
+            for mid, sender, content, ts, seq in rows
+        ]
@@ -0,0 +1,61 @@
+import itertools
+from PyQt6.QtCore import QTimer
+from shared.config import REQUEST_TIMEOUT
+
+
+class RequestTracker:
+    # Matches replies to requests by the request_id the server echoes, so
+    # several requests can be in flight on the one socket. Each request has
+    # a reply callback, an error callback (server errors, and timeouts
+    # unless a separate timeout callback is given) and an optional tag; cancelled requests are forgotten and their replies
+    # dropped when they turn up. Used from the Qt thread only.
+    def __init__(self, send, on_error, timeout=REQUEST_TIMEOUT):
+        self.send = send
+        self.on_error = on_error
+        self.timeout_ms = int(timeout * 1000)
+        self.ids = itertools.count(1)
+        self.pending = {}  # request_id -> (on_reply, on_error, tag, timer, on_timeout)
+
+    def request(self, data, on_reply=None, on_error=None, tag=None, on_timeout=None):
+        request_id = next(self.ids)
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: self._expire(request_id))
+        on_error = on_error or self.on_error
+        self.pending[request_id] = (on_reply, on_error, tag, timer, on_timeout or on_error)
+        timer.start(self.timeout_ms)
+        self.send(dict(data, request_id=request_id))
+        return request_id
+
+    def resolve(self, response):
+        # False for replies nobody waits for any more.
+        entry = self.pending.pop(response.get("request_id"), None)
+        if entry is None:
+            return False
+        on_reply, on_error, _, timer, _ = entry
+        timer.stop()
+        if response.get("status") == "error":
+            on_error(response.get("message", "Unknown error"))
+        elif on_reply:
+            on_reply(response)
+        return True
+
+    def cancel(self, request_id):
+        entry = self.pending.pop(request_id, None)
+        if entry is not None:
+            entry[3].stop()
+
+    def cancel_tag(self, tag):
+        cancelled = [request_id for request_id, entry in self.pending.items() if entry[2] == tag]
+        for request_id in cancelled:
+            self.cancel(request_id)
+        return len(cancelled)
+
+    def cancel_all(self):
+        for request_id in list(self.pending):
+            self.cancel(request_id)
+
+    def _expire(self, request_id):
+        entry = self.pending.pop(request_id, None)
+        if entry is not None:
+            entry[4]("Request timed out")
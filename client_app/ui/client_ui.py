@@ -3,6 +3,7 @@ from PyQt6.QtWidgets import (
     QTextEdit, QVBoxLayout, QHBoxLayout, QSplitter
 )
 from PyQt6.QtCore import Qt
+from .message_view import MessageListView
 
 
 class ClientUI(QWidget):
@@ -29,10 +30,29 @@ class ClientUI(QWidget):
         chat_creation_layout.addWidget(self.chat_members_input)
         chat_creation_layout.addWidget(self.create_chat_button)
 
+        # Message search controls
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search messages")
+        self.search_button = QPushButton("Search")
+        self.search_results = QListWidget()
+        self.search_more_button = QPushButton("More Results")
+        self.search_more_button.setEnabled(False)
+
+        search_input_layout = QHBoxLayout()
+        search_input_layout.addWidget(self.search_input)
+        search_input_layout.addWidget(self.search_button)
+
+        search_layout = QVBoxLayout()
+        search_layout.addWidget(QLabel("Search"))
+        search_layout.addLayout(search_input_layout)
+        search_layout.addWidget(self.search_results)
+        search_layout.addWidget(self.search_more_button)
+
         left_layout = QVBoxLayout()
         left_layout.addWidget(QLabel("Chats"))
         left_layout.addWidget(self.chat_list_widget)
         left_layout.addLayout(chat_creation_layout)
+        left_layout.addLayout(search_layout)
 
         left_widget = QWidget()
         left_widget.setLayout(left_layout)
@@ -61,8 +81,8 @@ class ClientUI(QWidget):
         login_layout.addWidget(self.register_button)
 
         # Messages display
-        self.chat_messages = QTextEdit()
-        self.chat_messages.setReadOnly(True)
+        self.chat_messages = MessageListView()
+        self.presence_label = QLabel()
 
         # Message input area
         self.message_input = QLineEdit()
@@ -77,12 +97,17 @@ class ClientUI(QWidget):
         self.add_users_input = QLineEdit()
         self.add_users_input.setPlaceholderText("Add users (comma-separated keywords)")
         self.add_users_button = QPushButton("Add Users")
+        self.rename_chat_input = QLineEdit()
+        self.rename_chat_input.setPlaceholderText("New chat name")
+        self.rename_chat_button = QPushButton("Rename")
         self.leave_chat_button = QPushButton("Leave Chat")
         self.delete_chat_button = QPushButton("Delete Chat")
 
         chat_manage_layout = QHBoxLayout()
         chat_manage_layout.addWidget(self.add_users_input)
         chat_manage_layout.addWidget(self.add_users_button)
+        chat_manage_layout.addWidget(self.rename_chat_input)
+        chat_manage_layout.addWidget(self.rename_chat_button)
         chat_manage_layout.addWidget(self.leave_chat_button)
         chat_manage_layout.addWidget(self.delete_chat_button)
 
@@ -99,6 +124,7 @@ class ClientUI(QWidget):
         right_layout.addLayout(login_layout)
         right_layout.addWidget(QLabel("Chat Messages"))
         right_layout.addWidget(self.chat_messages)
+        right_layout.addWidget(self.presence_label)
         right_layout.addLayout(message_layout)
         right_layout.addLayout(chat_manage_layout)
         right_layout.addWidget(QLabel("Logs"))
@@ -123,9 +149,35 @@ class ClientUI(QWidget):
         self.log_console.append(text)
 
     def append_chat_message(self, text: str):
-        self.chat_messages.append(text)
+        self.chat_messages.append_lines([text])
+
+    def set_chat_messages(self, lines: list):
+        self.chat_messages.set_lines(lines)
+
+    def append_chat_messages(self, lines: list):
+        self.chat_messages.append_lines(lines)
+
+    def prepend_chat_messages(self, lines: list):
+        self.chat_messages.prepend_lines(lines)
+
+    def set_presence_text(self, text: str):
+        self.presence_label.setText(text)
+
+    def find_chat_item(self, chat_id: str):
+        for row in range(self.chat_list_widget.count()):
+            item = self.chat_list_widget.item(row)
+            if item.data(Qt.ItemDataRole.UserRole) == chat_id:
+                return item
+        return None
 
     def create_chat_list_item(self, name: str, chat_id: str) -> QListWidgetItem:
         item = QListWidgetItem(name)
         item.setData(Qt.ItemDataRole.UserRole, chat_id)
         return item
+
+    def append_search_results(self, results: list):
+        for text, chat_id in results:
+            item = QListWidgetItem(text)
+            item.setData(Qt.ItemDataRole.UserRole, chat_id)
+            item.setToolTip(text)
+            self.search_results.addItem(item)
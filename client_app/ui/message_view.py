@@ -0,0 +1,86 @@
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, pyqtSignal
+
+
+class MessageListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lines = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self.lines[index.row()]
+        return None
+
+    def set_lines(self, lines):
+        self.beginResetModel()
+        self.lines = list(lines)
+        self.endResetModel()
+
+    def append_lines(self, lines):
+        if not lines:
+            return
+        first = len(self.lines)
+        self.beginInsertRows(QModelIndex(), first, first + len(lines) - 1)
+        self.lines.extend(lines)
+        self.endInsertRows()
+
+    def prepend_lines(self, lines):
+        if not lines:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(lines) - 1)
+        self.lines[:0] = lines
+        self.endInsertRows()
+
+
+class MessageListView(QListView):
+    # Model/view message list: only visible rows are painted, and uniform
+    # row heights let Qt skip measuring every message. Full text of long
+    # messages is in the tooltip. Scrolling to the top asks for older ones.
+    older_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.message_model = MessageListModel(self)
+        self.setModel(self.message_model)
+        self.setUniformItemSizes(True)
+        self.setWordWrap(False)
+        self.setTextElideMode(Qt.TextElideMode.ElideRight)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerItem)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+    def _on_scrolled(self, value):
+        if value == self.verticalScrollBar().minimum() and self.message_model.rowCount():
+            self.older_requested.emit()
+
+    def _at_bottom(self):
+        scrollbar = self.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum()
+
+    def set_lines(self, lines):
+        self.message_model.set_lines(lines)
+        self.scrollToBottom()
+
+    def append_lines(self, lines):
+        follow = self._at_bottom()
+        self.message_model.append_lines(lines)
+        if follow:
+            self.scrollToBottom()
+
+    def prepend_lines(self, lines):
+        # In per-item scroll mode the scrollbar value is the first visible
+        # row, so shifting it by the rows inserted keeps the view in place.
+        scrollbar = self.verticalScrollBar()
+        first_visible = scrollbar.value()
+        self.message_model.prepend_lines(lines)
+        scrollbar.setValue(first_visible + len(lines))
+
+    def clear(self):
+        self.message_model.set_lines([])
@@ -0,0 +1,62 @@
+import gzip
+import json
+import os
+
+# Archived messages live outside SQLite as gzip-compressed JSON lines, one
+# segment file per chat, month and archiving pass:
+# <root>/<chat_id>/<YYYY-MM>-<first id>.jsonl.gz. python_db keeps the
+# archive_segments index (id range and count per file), so a history page
+# only opens the segments it needs.
+
+
+def segment_name(chat_id, month, first_id):
+    # Path relative to the archive root, as stored in the index.
+    return os.path.join(chat_id, f"{month}-{first_id}.jsonl.gz")
+
+
+def write_segment(path, rows):
+    # rows: [(id, sender, content, timestamp, seq), ...]. Written to a temporary
+    # file, synced and renamed into place, so a segment is either complete
+    # or absent. A pass that dies before deleting the rows from the database
+    # picks the same rows again and replaces the segment.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                for mid, sender, content, ts, seq in rows:
+                    line = json.dumps(
+                        {"id": mid, "from": sender, "message": content, "timestamp": ts, "seq": seq},
+                        ensure_ascii=False
+                    )
+                    f.write(line.encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        # Leave nothing half-written behind (e.g. on a full disk).
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_segment(path):
+    # Rows in id order. Segments written before messages had sequence
+    # numbers give None for seq.
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            items = [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+    return [(item["id"], item["from"], item["message"], item["timestamp"], item.get("seq")) for item in items]
+
+
+def remove_chat(root, chat_id):
+    folder = os.path.join(root, chat_id)
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    os.rmdir(folder)
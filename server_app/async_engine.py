@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from shared.config import BUFFER_SIZE, DB_WORKERS
+from shared.protocol import FrameDecoder, FrameError
+from .outbound import AsyncConnection
+
+
+class AsyncServerEngine:
+    def __init__(self, app, host, port, db_workers=DB_WORKERS, reuse_port=False):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.db_workers = db_workers
+        self.loop = None
+        self.server = None
+        self.executor = None
+        self.thread = None
+
+    def start(self):
+        started = threading.Event()
+        errors = []
+        self.executor = ThreadPoolExecutor(max_workers=self.db_workers, thread_name_prefix="db-worker")
+        self.thread = threading.Thread(target=self._run, args=(started, errors), daemon=True)
+        self.thread.start()
+        started.wait()
+        if errors:
+            self.executor.shutdown(wait=False)
+            raise errors[0]
+
+    def stop(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self._shutdown)
+        self.thread.join(timeout=5)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.loop = None
+
+    def _run(self, started, errors):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(
+                self._handle_connection, self.host, self.port, reuse_address=True,
+                reuse_port=self.reuse_port or None, backlog=1024
+            ))
+        except Exception as e:
+            errors.append(e)
+            self.loop.close()
+            self.loop = None
+            started.set()
+            return
+        started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _shutdown(self):
+        self.server.close()
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        self.loop.call_later(0.1, self.loop.stop)
+
+    async def _handle_connection(self, reader, writer):
+        conn = AsyncConnection(self.loop, writer, metrics=self.app.outbound_metrics)
+        self.app.clients.append(conn)
+        self.app.log(f"Client connected from {conn.peer}")
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+
+                try:
+                    payloads = decoder.feed_payloads(data)
+                except FrameError as e:
+                    self.app.log(f"Dropping client after bad frame: {e}")
+                    break
+
+                for payload in payloads:
+                    await self.loop.run_in_executor(self.executor, self.app.dispatch_payload, conn, payload)
+        except asyncio.CancelledError:
+            pass
+        except ConnectionError:
+            self.app.log("Client closed the connection unexpectedly.")
+        except Exception as e:
+            self.app.log(f"Client error: {e}")
+        finally:
+            self.app.disconnect_client(conn)
+            conn.close()
@@ -0,0 +1,24 @@
+import threading
+
+
+class ChatListVersions:
+    # Per-user chat list version. Every delta pushed to a user carries the
+    # next version; a client that sees a gap falls back to get_chats.
+    # Versions live in memory only: after a restart clients resync fully.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}
+
+    def current(self, keyword):
+        with self.lock:
+            return self.versions.get(keyword, 0)
+
+    def push(self, keyword, connections, build_frame):
+        # Bumps the version and enqueues the frame under one lock, so
+        # deltas for a user are queued in version order.
+        with self.lock:
+            version = self.versions.get(keyword, 0) + 1
+            self.versions[keyword] = version
+            for conn in connections:
+                conn.send(build_frame(conn, version))
+            return version
@@ -0,0 +1,366 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from shared.config import CLUSTER_CALL_TIMEOUT
+from .server import ServerApp
+from .logs import LoggingSink
+from .profiling import install_profile_signal
+from .python_db import init_db, set_database, membership_cache
+
+# Sharded mode: N worker processes each run a full ServerApp on the same
+# port (SO_REUSEPORT, so the kernel spreads new connections across them)
+# and talk to a hub in the parent process over one pipe each.
+#
+# worker -> hub
+#   ("ready", worker_id) / ("failed", worker_id)
+#   ("online", keyword) / ("offline", keyword)   first/last local session
+#   ("deliver", members, frame)                  new_message for other shards
+#   ("chat_list", keywords, event)               chat list delta to number
+#   ("version", call_id, keyword)                current chat list version
+#   ("invalidate", chat_id)                      membership changed
+#   ("typing", chat_id, keyword, active)         typing indicator, rate limited
+# hub -> worker
+#   ("deliver", keywords, frame)
+#   ("chat_list", [(keyword, version), ...], event)
+#   ("reply", call_id, value)
+#   ("invalidate", chat_id)
+#   ("presence", keyword, online)                first/last session cluster-wide
+#   ("typing", chat_id, keyword, active)
+
+_STOP = object()
+
+
+class PipeSender:
+    # Writes to one end of a pipe from its own thread. A pipe's buffer is
+    # small, and a blocking send on a full one must never hold up the bus
+    # reader or the hub loop: each side would wait for the other to read.
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.queue = queue.SimpleQueue()
+        self.failed = False
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def send(self, message):
+        self.queue.put(message)
+
+    def close(self, timeout=None):
+        # Sends what is queued, then stops; joins the thread if given a timeout.
+        self.queue.put(_STOP)
+        if timeout is not None:
+            self.thread.join(timeout)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            if message is _STOP:
+                return
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError):
+                # The other end is gone; its reader notices and cleans up.
+                self.failed = True
+                return
+
+
+class WorkerBus:
+    # A shard's end of the pipe. Outgoing messages may come from any
+    # thread and are queued for a sender thread; incoming ones are handled
+    # by a single reader thread, so chat list deltas reach clients in the
+    # order the hub numbered them.
+    def __init__(self, app, conn):
+        self.app = app
+        self.conn = conn
+        self.sender = None
+        self.calls = {}
+        self.call_ids = itertools.count(1)
+        self.thread = None
+
+    def start(self):
+        self.app.cluster = self
+        self.app.sessions.on_presence = self.presence_changed
+        # Who is online comes from the hub, which sees every shard.
+        self.app.presence.cluster_online = set()
+        membership_cache.on_change = self.chat_members_changed
+        self.sender = PipeSender(self.conn, "cluster-bus-send")
+        self.thread = threading.Thread(target=self._run, daemon=True, name="cluster-bus")
+        self.thread.start()
+
+    def send(self, message):
+        self.sender.send(message)
+
+    def close(self, timeout=5):
+        self.sender.close(timeout)
+
+    def presence_changed(self, keyword, online):
+        self.send(("online" if online else "offline", keyword))
+
+    def chat_members_changed(self, chat_id):
+        self.send(("invalidate", chat_id))
+
+    def typing(self, chat_id, keyword, active):
+        self.send(("typing", chat_id, keyword, active))
+
+    def deliver(self, members, frame):
+        self.send(("deliver", tuple(members), frame))
+
+    def push_chat_list_event(self, keywords, event):
+        self.send(("chat_list", tuple(keywords), event))
+
+    def chat_list_version(self, keyword):
+        call_id = next(self.call_ids)
+        future = self.calls[call_id] = Future()
+        self.send(("version", call_id, keyword))
+        try:
+            return future.result(timeout=CLUSTER_CALL_TIMEOUT)
+        finally:
+            self.calls.pop(call_id, None)
+
+    def _run(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self._handle(message)
+            except Exception as e:
+                self.app.log(f"Cluster bus error: {e}")
+        self.app.log("Cluster bus closed")
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == "deliver":
+            self.app.deliver_to_members(message[1], message[2])
+        elif kind == "chat_list":
+            _, versions, event = message
+            for keyword, version in versions:
+                self.app.deliver_chat_list_event(keyword, version, event)
+        elif kind == "invalidate":
+            membership_cache.invalidate(message[1], notify=False)
+        elif kind == "presence":
+            self.app.presence.set_cluster_online(message[1], message[2])
+        elif kind == "typing":
+            _, chat_id, keyword, active = message
+            self.app.presence.set_typing(chat_id, keyword, active)
+        elif kind == "reply":
+            future = self.calls.get(message[1])
+            if future is not None:
+                future.set_result(message[2])
+
+
+class ClusterHub:
+    # Runs in the parent process on one thread, so routing state needs no
+    # locks and deltas for a user are numbered and sent in one order.
+    # Messages to a worker go through that pipe's PipeSender, so a shard
+    # that is slow to read never stalls routing for the others.
+    def __init__(self, log):
+        self.log = log
+        self.workers = {}    # worker_id -> pipe
+        self.senders = {}    # worker_id -> PipeSender
+        self.ids = {}        # pipe -> worker_id
+        self.ready = set()
+        self.locations = {}  # keyword -> worker ids holding a session
+        self.versions = {}   # keyword -> chat list version
+        self.routed = 0
+
+    def add_worker(self, worker_id, conn):
+        self.workers[worker_id] = conn
+        self.senders[worker_id] = PipeSender(conn, f"cluster-hub-send-{worker_id}")
+        self.ids[conn] = worker_id
+
+    def remove_worker(self, worker_id):
+        conn = self.workers.pop(worker_id, None)
+        if conn is None:
+            return
+        del self.ids[conn]
+        self.senders.pop(worker_id).close()
+        self.ready.discard(worker_id)
+        for keyword in [k for k, ids in self.locations.items() if worker_id in ids]:
+            self._set_offline(keyword, worker_id)
+        self.log(f"Shard {worker_id} left the cluster")
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while len(self.ready) < len(self.workers) and time.monotonic() < deadline:
+            if not self.pump(0.5):
+                return False
+        return bool(self.workers) and len(self.ready) == len(self.workers)
+
+    def run(self, stopped):
+        while self.workers and not stopped.is_set():
+            self.pump(0.5)
+
+    def pump(self, timeout):
+        # Handles whatever arrives within `timeout`; False if a shard failed.
+        for conn in wait(list(self.ids), timeout=timeout):
+            worker_id = self.ids.get(conn)
+            if worker_id is None:
+                continue
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                self.remove_worker(worker_id)
+                continue
+            if message[0] == "failed":
+                self.remove_worker(worker_id)
+                return False
+            self.handle(worker_id, message)
+        return True
+
+    def handle(self, origin, message):
+        kind = message[0]
+        if kind == "deliver":
+            _, members, frame = message
+            targets = {}
+            for keyword in members:
+                for worker_id in self.locations.get(keyword, ()):
+                    if worker_id != origin:
+                        targets.setdefault(worker_id, []).append(keyword)
+            for worker_id, keywords in targets.items():
+                self.send(worker_id, ("deliver", keywords, frame))
+        elif kind == "chat_list":
+            _, keywords, event = message
+            targets = {}
+            for keyword in keywords:
+                version = self.versions[keyword] = self.versions.get(keyword, 0) + 1
+                for worker_id in self.locations.get(keyword, ()):
+                    targets.setdefault(worker_id, []).append((keyword, version))
+            for worker_id, versions in targets.items():
+                self.send(worker_id, ("chat_list", versions, event))
+        elif kind == "version":
+            _, call_id, keyword = message
+            self.send(origin, ("reply", call_id, self.versions.get(keyword, 0)))
+        elif kind in ("invalidate", "typing"):
+            for worker_id in list(self.workers):
+                if worker_id != origin:
+                    self.send(worker_id, message)
+        elif kind == "online":
+            ids = self.locations.setdefault(message[1], set())
+            if not ids:
+                self._broadcast(("presence", message[1], True))
+            ids.add(origin)
+        elif kind == "offline":
+            self._set_offline(message[1], origin)
+        elif kind == "ready":
+            self.ready.add(origin)
+            self.log(f"Shard {origin} ready")
+
+    def _set_offline(self, keyword, worker_id):
+        ids = self.locations.get(keyword)
+        if ids is not None:
+            ids.discard(worker_id)
+            if not ids:
+                del self.locations[keyword]
+                self._broadcast(("presence", keyword, False))
+
+    def _broadcast(self, message):
+        for worker_id in list(self.workers):
+            self.send(worker_id, message)
+
+    def send(self, worker_id, message):
+        sender = self.senders.get(worker_id)
+        if sender is None:
+            return
+        if sender.failed:
+            self.remove_worker(worker_id)
+            return
+        sender.send(message)
+        self.routed += 1
+
+    def stats(self):
+        return {
+            "workers": len(self.workers),
+            "online_users": len(self.locations),
+            "routed_messages": self.routed,
+            "queued_messages": sum(sender.depth() for sender in self.senders.values()),
+        }
+
+
+def run_worker(worker_id, conn, host, port, db, engine, log_level, metrics_port=None, metrics_file=None):
+    logging.basicConfig(
+        level=log_level.upper(),
+        format=f"%(asctime)s %(levelname)s [shard {worker_id}] %(message)s"
+    )
+    set_database(db)
+    # Every shard reports its own metrics: ports count up from
+    # metrics_port and dump files get a per-shard suffix.
+    server = ServerApp(
+        engine=engine, host=host, port=port, reuse_port=True,
+        metrics_port=metrics_port + worker_id if metrics_port else metrics_port,
+        metrics_file=f"{metrics_file}.shard{worker_id}" if metrics_file else None,
+        run_maintenance=worker_id == 0
+    )
+    server.log.subscribe(LoggingSink())
+    bus = WorkerBus(server, conn)
+    bus.start()
+    if not server.start_server():
+        bus.send(("failed", worker_id))
+        bus.close()
+        return
+
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+    install_profile_signal(server.profiler)
+    bus.send(("ready", worker_id))
+    while not stopped.wait(1):
+        if not bus.thread.is_alive():
+            break  # The hub is gone
+
+    server.stop_server()
+    bus.close()
+
+
+def run_cluster(workers, host, port, db, engine, log_level, metrics_port=None, metrics_file=None):
+    log = LoggingSink(logging.getLogger("messenger.cluster"))
+    if not hasattr(socket, "SO_REUSEPORT"):
+        log("❌ Sharded mode needs SO_REUSEPORT, which this platform lacks")
+        return 1
+
+    # Migrations run once here, before any shard opens the database.
+    set_database(db)
+    init_db()
+
+    ctx = multiprocessing.get_context("spawn")
+    hub = ClusterHub(log)
+    processes = []
+    for worker_id in range(workers):
+        hub_end, worker_end = ctx.Pipe()
+        process = ctx.Process(
+            target=run_worker, name=f"shard-{worker_id}",
+            args=(worker_id, worker_end, host, port, db, engine, log_level, metrics_port, metrics_file)
+        )
+        process.start()
+        worker_end.close()
+        hub.add_worker(worker_id, hub_end)
+        processes.append(process)
+
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+
+    exit_code = 0
+    if hub.wait_ready(timeout=30):
+        log(f"✅ Cluster of {workers} shards serving {host}:{port} ({engine} engine)")
+        hub.run(stopped)
+    else:
+        log("❌ Not every shard started; shutting the cluster down")
+        exit_code = 1
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+    return exit_code
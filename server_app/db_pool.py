@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+import weakref
+from shared.config import (
+    DB_SYNCHRONOUS, DB_CACHE_SIZE_KB, DB_STATEMENT_CACHE_SIZE, DB_BUSY_TIMEOUT_MS
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    # Subclassed only so the pool can hold weak references to it.
+    pass
+
+
+class ConnectionPool:
+    # One long-lived connection per thread. Reusing the connection keeps
+    # sqlite3's prepared statement cache warm, and WAL lets readers run
+    # alongside the single writer instead of queueing behind it.
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.local = threading.local()
+        self.connections = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self.local.conn = conn
+        return conn
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        # Lets retention hand freed pages back a few at a time. It has to come
+        # before WAL and only sticks on a new file; older databases need one
+        # offline VACUUM (python -m server_app.retention --vacuum).
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self.lock:
+            self.connections.add(conn)
+            self.opened += 1
+        return conn
+
+    def release(self):
+        # Close the calling thread's connection, e.g. before the thread exits.
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            self.local.conn = None
+            with self.lock:
+                self.connections.discard(conn)
+            conn.close()
+
+    def close_all(self):
+        with self.lock:
+            connections = list(self.connections)
+            self.connections = weakref.WeakSet()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self.local = threading.local()
+
+    def stats(self):
+        with self.lock:
+            return {"open": len(self.connections), "opened_total": self.opened}
@@ -0,0 +1,56 @@
+import argparse
+import logging
+import signal
+import threading
+from shared.config import HOST, PORT, SERVER_ENGINE, DB_NAME, CLUSTER_WORKERS, METRICS_PORT, METRICS_FILE
+from .server import ServerApp
+from .logs import LoggingSink
+from .cluster import run_cluster
+from .profiling import install_profile_signal
+from .python_db import init_db, set_database
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the messenger server without a GUI")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default=DB_NAME, help="SQLite database file")
+    parser.add_argument("--engine", choices=["asyncio", "threaded"], default=SERVER_ENGINE)
+    parser.add_argument("--workers", type=int, default=CLUSTER_WORKERS,
+                        help="Server processes sharing the port (sharded mode when > 1)")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Serve JSON metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", default=METRICS_FILE, help="Append periodic metrics snapshots (JSONL)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.workers > 1:
+        return run_cluster(args.workers, args.host, args.port, args.db, args.engine, args.log_level,
+                           args.metrics_port, args.metrics_file)
+
+    set_database(args.db)
+    init_db()
+    server = ServerApp(engine=args.engine, host=args.host, port=args.port,
+                       metrics_port=args.metrics_port, metrics_file=args.metrics_file)
+    server.log.subscribe(LoggingSink())
+    if not server.start_server():
+        return 1
+
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+    install_profile_signal(server.profiler)
+    while not stopped.wait(1):
+        pass
+
+    server.stop_server()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+import logging
+import threading
+from collections import deque
+
+LOG_QUEUE_SIZE = 1000
+
+
+class LogHub:
+    # Fans server log lines out to any number of sinks. A sink is any
+    # callable taking the message; it may be called from any thread.
+    def __init__(self):
+        self.sinks = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, sink):
+        with self.lock:
+            self.sinks = self.sinks + [sink]
+
+    def unsubscribe(self, sink):
+        with self.lock:
+            self.sinks = [s for s in self.sinks if s is not sink]
+
+    def __call__(self, message):
+        for sink in self.sinks:
+            try:
+                sink(message)
+            except Exception:
+                pass
+
+
+class LoggingSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("messenger.server")
+        self.level = level
+
+    def __call__(self, message):
+        self.logger.log(self.level, message)
+
+
+class QueueSink:
+    # Keeps the newest `maxlen` lines; older ones are dropped rather than
+    # blocking the handler that logged them.
+    def __init__(self, maxlen=LOG_QUEUE_SIZE):
+        self.lines = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def __call__(self, message):
+        with self.lock:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped += 1
+            self.lines.append(message)
+
+    def drain(self):
+        with self.lock:
+            lines = list(self.lines)
+            self.lines.clear()
+        return lines
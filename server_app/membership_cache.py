@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from shared.config import MEMBERSHIP_CACHE_SIZE
+
+
+class MembershipCache:
+    # chat_id -> frozenset of member keywords, filled lazily from `loader`
+    # and kept in LRU order. Every mutation bumps `generation`, and a load
+    # that raced with a mutation is not stored, so a stale member list can
+    # never overwrite a fresher one. on_change(chat_id), if set, is told
+    # about every local mutation (the sharded server forwards it to the
+    # other workers, which apply it with invalidate(chat_id, notify=False)).
+    def __init__(self, loader, max_entries=MEMBERSHIP_CACHE_SIZE):
+        self.loader = loader
+        self.on_change = None
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chat_id):
+        with self.lock:
+            members = self.entries.get(chat_id)
+            if members is not None:
+                self.entries.move_to_end(chat_id)
+                self.hits += 1
+                return members
+            self.misses += 1
+            generation = self.generation
+
+        members = frozenset(self.loader(chat_id))
+
+        with self.lock:
+            if generation == self.generation:
+                self.entries[chat_id] = members
+                self.entries.move_to_end(chat_id)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return members
+
+    def add_members(self, chat_id, keywords):
+        with self.lock:
+            self.generation += 1
+            members = self.entries.get(chat_id)
+            if members is not None:
+                self.entries[chat_id] = members | frozenset(keywords)
+        self._notify(chat_id)
+
+    def remove_member(self, chat_id, keyword):
+        with self.lock:
+            self.generation += 1
+            members = self.entries.get(chat_id)
+            if members is not None:
+                self.entries[chat_id] = members - {keyword}
+        self._notify(chat_id)
+
+    def invalidate(self, chat_id, notify=True):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(chat_id, None)
+        if notify:
+            self._notify(chat_id)
+
+    def _notify(self, chat_id):
+        if self.on_change:
+            self.on_change(chat_id)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from shared.config import WRITE_BATCH_SIZE, WRITE_BATCH_LATENCY, WRITE_TIMEOUT, DB_WRITER_SYNCHRONOUS
+from .python_db import add_messages, release_connection, set_synchronous
+
+_STOP = object()
+
+
+class MessageWriter:
+    # Group commit for chat messages. Handlers submit() and wait on the
+    # returned future; a single writer thread collects up to batch_size
+    # messages (waiting at most max_latency after the first) and commits
+    # them in one transaction, so the fsync cost is shared by the batch.
+    # The writer's connection runs with synchronous=FULL (even in WAL mode,
+    # where the rest of the server uses NORMAL), so a message is durable
+    # before write() returns and the sender gets its ack.
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, max_latency=WRITE_BATCH_LATENCY, insert_batch=add_messages,
+                 synchronous=DB_WRITER_SYNCHRONOUS):
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max_latency
+        self.insert_batch = insert_batch
+        self.synchronous = synchronous
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()  # orders submit() against stop()
+        self.stopped = False
+        self.batches = 0
+        self.messages = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        with self.lock:
+            self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Messages submitted before stop() are still written; later ones
+        # fail straight away instead of waiting for a writer that is gone.
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.queue.put(_STOP)
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[0].set_exception(RuntimeError("Message writer stopped"))
+
+    def submit(self, chat_id, sender, content, timestamp, client_msg_id=None):
+        future = Future()
+        with self.lock:
+            if self.stopped:
+                future.set_exception(RuntimeError("Message writer stopped"))
+            else:
+                self.queue.put((future, (chat_id, sender, content, timestamp, client_msg_id)))
+        return future
+
+    def write(self, chat_id, sender, content, timestamp, client_msg_id=None, timeout=WRITE_TIMEOUT):
+        # Blocks until the message is committed; returns (id, seq, duplicate)
+        # as add_messages does. Raises if the writer is stopped or the commit
+        # takes longer than timeout; the sender then gets no ack and resends
+        # with the same client_msg_id, so a late commit is not stored twice.
+        return self.submit(chat_id, sender, content, timestamp, client_msg_id).result(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "batches": self.batches,
+            "messages": self.messages,
+            "avg_batch": round(self.messages / self.batches, 2) if self.batches else 0,
+        }
+
+    def _run(self):
+        stopping = False
+        try:
+            set_synchronous(self.synchronous)
+            while not stopping:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_latency
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        if remaining > 0:
+                            item = self.queue.get(timeout=remaining)
+                        else:
+                            item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._flush(batch)
+        finally:
+            release_connection()
+
+    def _flush(self, batch):
+        try:
+            results = self.insert_batch([row for _, row in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][0].set_exception(e)
+                return
+            # The transaction was rolled back; write the rows one at a time
+            # so only the offending message fails.
+            for item in batch:
+                self._flush([item])
+            return
+        self.batches += 1
+        self.messages += len(batch)
+        for (future, _), result in zip(batch, results):
+            future.set_result(result)
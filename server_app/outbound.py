@@ -0,0 +1,191 @@
+import asyncio
+import socket
+import threading
+from collections import deque
+from shared.config import OUTBOUND_MAX_BYTES, SLOW_CONSUMER_POLICY
+from shared.codec import JSON
+
+POLICIES = ("drop", "disconnect")
+
+
+class OutboundMetrics:
+    # Totals shared by every connection of a server.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped_frames = 0
+        self.slow_disconnects = 0
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "dropped_frames": self.dropped_frames,
+                "slow_disconnects": self.slow_disconnects,
+            }
+
+
+class OutboundQueue:
+    # Frames waiting to be written to one client, bounded by max_bytes.
+    # What happens when a frame does not fit depends on the policy:
+    #   drop       - the new frame is discarded
+    #   disconnect - the client is disconnected
+    # Frames are never merged in the queue: chat list and presence frames
+    # carry deltas, so each one has to arrive.
+    def __init__(self, max_bytes=OUTBOUND_MAX_BYTES, policy=SLOW_CONSUMER_POLICY, metrics=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.metrics = metrics or OutboundMetrics()
+        self.frames = deque()
+        self.bytes = 0
+        self.closed = False
+        self.ready = threading.Condition()
+
+    def put(self, data):
+        # Returns False if the frame was not queued; `closed` tells whether
+        # the connection has to be dropped as a slow consumer.
+        with self.ready:
+            if self.closed:
+                return False
+            if self.bytes + len(data) > self.max_bytes and self.frames:
+                if self.policy == "drop":
+                    self.metrics.count("dropped_frames")
+                    return False
+                self.metrics.count("slow_disconnects")
+                self._close()
+                return False
+            self.frames.append(data)
+            self.bytes += len(data)
+            self.ready.notify()
+            return True
+
+    def pop_all(self):
+        with self.ready:
+            return self._pop_all()
+
+    def wait_pop_all(self):
+        # Blocks until frames are queued; returns [] once the queue is closed.
+        with self.ready:
+            while not self.frames and not self.closed:
+                self.ready.wait()
+            return self._pop_all()
+
+    def _pop_all(self):
+        frames = list(self.frames)
+        self.frames.clear()
+        self.bytes = 0
+        return frames
+
+    def close(self):
+        with self.ready:
+            self._close()
+
+    def _close(self):
+        self.closed = True
+        self.ready.notify_all()
+
+    def depth(self):
+        with self.ready:
+            return len(self.frames), self.bytes
+
+
+class SocketConnection:
+    # Threaded engine: a blocking socket with its own writer thread, so a
+    # stalled client only ever blocks that thread.
+    def __init__(self, sock, addr, metrics=None):
+        self.sock = sock
+        self.peer = addr
+        self.codec = JSON
+        self.outbound = OutboundQueue(metrics=metrics)
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+
+    def send(self, data):
+        queued = self.outbound.put(data)
+        if not queued and self.outbound.closed:
+            self.close()
+        return queued
+
+    def recv(self, size):
+        return self.sock.recv(size)
+
+    def _write_loop(self):
+        while True:
+            frames = self.outbound.wait_pop_all()
+            if not frames:
+                break
+            try:
+                self.sock.sendall(b"".join(frames))
+            except OSError:
+                self.close()
+                break
+
+    def shutdown(self, _how=None):
+        self.close()
+
+    def close(self):
+        self.outbound.close()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class AsyncConnection:
+    # asyncio engine: handlers run on executor threads and only enqueue;
+    # a writer task on the event loop drains the queue and awaits drain().
+    def __init__(self, loop, writer, metrics=None):
+        self.loop = loop
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+        self.codec = JSON
+        self.outbound = OutboundQueue(metrics=metrics)
+        self.wakeup = asyncio.Event()
+        self.writer_task = loop.create_task(self._write_loop())
+
+    def send(self, data):
+        queued = self.outbound.put(data)
+        if queued:
+            self._call_soon(self.wakeup.set)
+        elif self.outbound.closed:
+            self.close()
+        return queued
+
+    async def _write_loop(self):
+        try:
+            while not self.outbound.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                frames = self.outbound.pop_all()
+                if frames:
+                    self.writer.write(b"".join(frames))
+                    await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def _call_soon(self, callback):
+        try:
+            self.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _abort(self):
+        self.writer_task.cancel()
+        # abort() rather than close(): a stalled peer would never let
+        # close() flush the transport buffer.
+        self.writer.transport.abort()
+
+    def shutdown(self, _how=None):
+        self.close()
+
+    def close(self):
+        self.outbound.close()
+        self._call_soon(self._abort)
@@ -0,0 +1,220 @@
+import threading
+import time
+from shared.config import PRESENCE_FLUSH_INTERVAL, TYPING_TIMEOUT, TYPING_MIN_INTERVAL
+from shared.protocol import encode_frame
+from .metrics import metrics, SIZE_BUCKETS
+from .python_db import get_chat_members, release_connection
+
+
+class PresenceTracker:
+    # Online/offline and typing state for the chats clients have on screen.
+    # A connection watches at most one chat, and only chats that someone
+    # watches or types in have entries, so memory follows what is on screen
+    # rather than the number of users or chats.
+    #
+    # Changes are not pushed as they happen: they are marked dirty and a
+    # flusher thread sends at most one "presence" frame per watched chat
+    # every flush_interval, however many users started or stopped typing or
+    # came and went in between. Refreshing an ongoing typing indicator only
+    # moves its expiry and sends nothing.
+    def __init__(self, sessions, log, flush_interval=PRESENCE_FLUSH_INTERVAL,
+                 typing_timeout=TYPING_TIMEOUT, typing_min_interval=TYPING_MIN_INTERVAL):
+        self.sessions = sessions
+        self.log = log
+        self.flush_interval = flush_interval
+        self.typing_timeout = typing_timeout
+        # Clients send one event per typing_min_interval; accept up to twice
+        # that rate so network jitter does not drop a refresh.
+        self.typing_min_gap = typing_min_interval / 2
+        self.lock = threading.Lock()
+        self.watching = {}      # conn -> chat_id
+        self.watchers = {}      # chat_id -> set of conns
+        self.typing = {}        # chat_id -> {keyword: expires at (monotonic)}
+        self.last_typing = {}   # conn -> time of its last accepted typing event
+        self.dirty_chats = set()    # chats whose set of typing users changed
+        self.dirty_users = {}       # keyword -> online, changed since the last flush
+        self.cluster_online = None  # keywords online on any shard, when sharded
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="presence", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.stopped.set()
+        self.thread.join(timeout=5)
+        self.thread = None
+
+    def is_online(self, keyword):
+        if self.cluster_online is not None:
+            return keyword in self.cluster_online
+        return self.sessions.is_online(keyword)
+
+    def user_presence_changed(self, keyword, online):
+        # SessionRegistry.on_presence hook.
+        with self.lock:
+            self.dirty_users[keyword] = online
+
+    def set_cluster_online(self, keyword, online):
+        with self.lock:
+            if online:
+                self.cluster_online.add(keyword)
+            else:
+                self.cluster_online.discard(keyword)
+            self.dirty_users[keyword] = online
+
+    def watch(self, conn, chat_id, members):
+        # Replaces what conn watched before; returns the current state of
+        # chat_id, which the client gets once instead of a replay of events.
+        with self.lock:
+            self._unwatch(conn)
+            self.watching[conn] = chat_id
+            self.watchers.setdefault(chat_id, set()).add(conn)
+            typing = sorted(self.typing.get(chat_id, ()))
+        online = sorted(keyword for keyword in members if self.is_online(keyword))
+        return {"online": online, "typing": typing}
+
+    def unwatch(self, conn):
+        with self.lock:
+            self._unwatch(conn)
+
+    def forget(self, conn):
+        # Connection closed.
+        with self.lock:
+            self._unwatch(conn)
+            self.last_typing.pop(conn, None)
+
+    def _unwatch(self, conn):
+        chat_id = self.watching.pop(conn, None)
+        if chat_id is None:
+            return
+        conns = self.watchers.get(chat_id)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                del self.watchers[chat_id]
+
+    def typing_started(self, conn, chat_id, keyword):
+        # False when conn sends typing events faster than allowed; those
+        # are dropped and not forwarded to other shards either.
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_typing.get(conn)
+            if last is not None and now - last < self.typing_min_gap:
+                metrics.count("presence.typing_dropped")
+                return False
+            self.last_typing[conn] = now
+            self._set_typing(chat_id, keyword, now)
+        metrics.count("presence.typing_events")
+        return True
+
+    def set_typing(self, chat_id, keyword, active):
+        # Typing state reported by another shard, already rate limited there.
+        with self.lock:
+            if active:
+                self._set_typing(chat_id, keyword, time.monotonic())
+            else:
+                self._clear_typing(chat_id, keyword)
+
+    def typing_stopped(self, chat_id, keyword):
+        # The user sent their message; True if they were shown as typing.
+        with self.lock:
+            return self._clear_typing(chat_id, keyword)
+
+    def _set_typing(self, chat_id, keyword, now):
+        entries = self.typing.setdefault(chat_id, {})
+        if keyword not in entries:
+            self.dirty_chats.add(chat_id)
+        entries[keyword] = now + self.typing_timeout
+
+    def _clear_typing(self, chat_id, keyword):
+        entries = self.typing.get(chat_id)
+        if not entries or entries.pop(keyword, None) is None:
+            return False
+        if not entries:
+            del self.typing[chat_id]
+        self.dirty_chats.add(chat_id)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "watching_connections": len(self.watching),
+                "watched_chats": len(self.watchers),
+                "typing_chats": len(self.typing),
+                "typing_users": sum(len(entries) for entries in self.typing.values()),
+            }
+
+    def _run(self):
+        try:
+            while not self.stopped.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.log(f"Presence flush failed: {e}")
+        finally:
+            release_connection()
+
+    def flush(self):
+        now = time.monotonic()
+        with self.lock:
+            for chat_id, entries in list(self.typing.items()):
+                # Expired, or the user has gone offline meanwhile.
+                expired = [
+                    keyword for keyword, expires in entries.items()
+                    if expires <= now or self.dirty_users.get(keyword) is False
+                ]
+                for keyword in expired:
+                    self._clear_typing(chat_id, keyword)
+            dirty_chats, self.dirty_chats = self.dirty_chats, set()
+            dirty_users, self.dirty_users = self.dirty_users, {}
+            if not dirty_chats and not dirty_users:
+                return
+            updates = []
+            for chat_id, conns in self.watchers.items():
+                if chat_id in dirty_chats:
+                    typing = sorted(self.typing.get(chat_id, ()))
+                elif dirty_users:
+                    typing = None
+                else:
+                    continue
+                updates.append((chat_id, tuple(conns), typing))
+
+        for chat_id, conns, typing in updates:
+            update = {}
+            if typing is not None:
+                update["typing"] = typing
+            if dirty_users:
+                # Whichever side is smaller is walked; both are sets/dicts.
+                members = get_chat_members(chat_id)
+                if len(members) < len(dirty_users):
+                    changed = [k for k in members if k in dirty_users]
+                else:
+                    changed = [k for k in dirty_users if k in members]
+                online = [k for k in changed if dirty_users[k]]
+                offline = [k for k in changed if not dirty_users[k]]
+                if online:
+                    update["online"] = online
+                if offline:
+                    update["offline"] = offline
+            if update:
+                self._send(conns, dict(update, action="presence", chat_id=chat_id))
+
+    def _send(self, conns, frame):
+        frames = {}  # encoded once per codec in use
+        sent_bytes = 0
+        for conn in conns:
+            data = frames.get(conn.codec)
+            if data is None:
+                data = frames[conn.codec] = encode_frame(frame, conn.codec)
+            conn.send(data)
+            sent_bytes += len(data)
+        metrics.count("presence.frames", len(conns))
+        metrics.count("presence.bytes", sent_bytes)
+        metrics.observe("presence.fanout", len(conns), SIZE_BUCKETS)
@@ -0,0 +1,174 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from shared.config import PROFILE_DIR, PROFILE_DEFAULT_SECONDS, PROFILE_TRACEMALLOC_FRAMES
+
+REPORT_LINES = 60
+
+# Up to 3.11 a cProfile.Profile only sees the thread that enabled it, so each
+# thread needs its own. From 3.12 it is built on sys.monitoring, which allows
+# one profiler per process and sees every thread.
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+class Profiler:
+    # On-demand cProfile (and optionally tracemalloc) over a time window.
+    # While inactive, call() costs one attribute check. While active every
+    # thread that goes through call() gets its own cProfile.Profile, and
+    # they are merged into a single report when the window ends. Where
+    # cProfile is process-wide (3.12+) one profile runs for the whole
+    # window instead and covers every thread, so call() adds nothing.
+    def __init__(self, log, output_dir=PROFILE_DIR):
+        self.log = log
+        self.output_dir = output_dir
+        self.lock = threading.Condition()
+        self.active = False
+        self.session = 0
+        self.profiles = []
+        self.in_flight = 0
+        self.local = threading.local()
+        self.started_at = None
+        self.memory_baseline = None
+        self.timer = None
+
+    def call(self, func, *args):
+        if not self.active or not PER_THREAD_PROFILES:
+            return func(*args)
+        profile = self._thread_profile()
+        if profile is None:
+            return func(*args)
+        self.local.inside = True
+        try:
+            profile.enable()
+            return func(*args)
+        finally:
+            profile.disable()
+            self.local.inside = False
+            with self.lock:
+                self.in_flight -= 1
+                self.lock.notify_all()
+
+    def _thread_profile(self):
+        with self.lock:
+            if not self.active:
+                return None
+            if getattr(self.local, "session", None) != self.session:
+                self.local.session = self.session
+                self.local.profile = cProfile.Profile()
+                self.profiles.append(self.local.profile)
+            self.in_flight += 1
+            return self.local.profile
+
+    def start(self, duration=PROFILE_DEFAULT_SECONDS, trace_memory=False):
+        with self.lock:
+            if self.active:
+                return False
+            self.session += 1
+            self.profiles = []
+            if not PER_THREAD_PROFILES:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    # Another tool (a debugger, coverage) holds the profiler slot.
+                    self.log(f"Profiling not started: {e}")
+                    return False
+                self.profiles.append(profile)
+            self.started_at = time.time()
+            if trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self.memory_baseline = tracemalloc.take_snapshot()
+            self.active = True
+            if duration:
+                self.timer = threading.Timer(duration, self.stop)
+                self.timer.daemon = True
+                self.timer.start()
+        self.log(f"Profiling started ({duration or 'no'} second limit{', tracing memory' if trace_memory else ''})")
+        return True
+
+    def stop(self):
+        # Returns the paths of the reports written, or [] if not profiling.
+        with self.lock:
+            if not self.active:
+                return []
+            self.active = False
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            # Calls already inside a profiled handler finish first, so no
+            # profile is read while its thread is still recording (except
+            # our own, when stop() comes from a profiled admin request).
+            own = 1 if getattr(self.local, "inside", False) else 0
+            self.lock.wait_for(lambda: self.in_flight <= own, timeout=5)
+            profiles, self.profiles = self.profiles, []
+            if not PER_THREAD_PROFILES:
+                profiles[0].disable()
+            baseline, self.memory_baseline = self.memory_baseline, None
+            memory = tracemalloc.take_snapshot() if baseline is not None else None
+            if baseline is not None:
+                tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        base = os.path.join(self.output_dir, f"profile-{stamp}-{os.getpid()}")
+        reports = self._write_cpu_report(base, profiles, time.time() - self.started_at)
+        if memory is not None:
+            reports.append(self._write_memory_report(base, baseline, memory))
+        self.log(f"Profiling stopped, reports: {', '.join(reports) or 'none (no requests)'}")
+        return reports
+
+    def toggle(self):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def status(self):
+        with self.lock:
+            return {
+                "profiling": self.active,
+                "tracing_memory": self.memory_baseline is not None,
+                "threads": len(self.profiles),
+                "seconds": round(time.time() - self.started_at, 1) if self.active else 0,
+            }
+
+    def _write_cpu_report(self, base, profiles, elapsed):
+        profiles = [p for p in profiles if p.getstats()]
+        if not profiles:
+            return []
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(base + ".pstats")
+        text = io.StringIO()
+        if PER_THREAD_PROFILES:
+            text.write(f"{len(profiles)} threads profiled over {elapsed:.1f}s\n\n")
+        else:
+            text.write(f"All threads profiled together over {elapsed:.1f}s\n\n")
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+        stats.sort_stats("tottime").print_stats(REPORT_LINES)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        return [base + ".pstats", base + ".txt"]
+
+    def _write_memory_report(self, base, baseline, snapshot):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = snapshot.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), "lineno")
+        path = base + "-memory.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Allocations grown since profiling started, by line\n\n")
+            for stat in diff[:REPORT_LINES]:
+                f.write(f"{stat}\n")
+        return path
+
+
+def install_profile_signal(profiler):
+    # kill -USR1 <pid> starts a profiling window, a second one ends it early.
+    # The toggle runs off the signal handler, since stopping writes reports.
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: threading.Thread(target=profiler.toggle, daemon=True).start())
@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+import time
+from shared.config import PURGE_BATCH, PURGE_PAUSE, PURGE_INTERVAL
+from .metrics import metrics
+from .python_db import deleted_chats, purge_deleted_chat, release_connection
+
+
+class ChatPurger:
+    # Removes the messages of deleted chats in the background, PURGE_BATCH
+    # rows per transaction with a pause in between, so send_message never
+    # waits behind more than one batch. wake() starts a pass right away;
+    # otherwise leftovers (e.g. from before a restart) are picked up every
+    # PURGE_INTERVAL seconds.
+    def __init__(self, log, batch_size=PURGE_BATCH, pause=PURGE_PAUSE, interval=PURGE_INTERVAL):
+        self.log = log
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pending_chats = 0
+        self.current_chat = None
+        self.current_deleted = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.wakeup.set()  # Finish whatever an earlier run left behind
+        self.thread = threading.Thread(target=self._run, name="chat-purger", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join(timeout=10)
+        self.thread = None
+
+    def wake(self):
+        self.wakeup.set()
+
+    def stats(self):
+        return {
+            "pending_chats": self.pending_chats,
+            "current_chat": self.current_chat,
+            "current_chat_deleted_messages": self.current_deleted,
+        }
+
+    def _run(self):
+        try:
+            while not self.stopped.is_set():
+                self.wakeup.wait(self.interval)
+                self.wakeup.clear()
+                if self.stopped.is_set():
+                    break
+                try:
+                    self.run_once()
+                except (sqlite3.Error, OSError) as e:
+                    # Picked up again on the next interval.
+                    self.log(f"Chat purge failed: {e}")
+        finally:
+            release_connection()
+
+    def run_once(self):
+        chats = deleted_chats()
+        self.pending_chats = len(chats)
+        for chat_id in chats:
+            if self.stopped.is_set():
+                return
+            self.purge_chat(chat_id)
+            self.pending_chats -= 1
+
+    def purge_chat(self, chat_id):
+        started = time.perf_counter()
+        self.current_chat = chat_id
+        self.current_deleted = 0
+        try:
+            while not self.stopped.is_set():
+                deleted = purge_deleted_chat(chat_id, self.batch_size)
+                if deleted == 0:
+                    metrics.count("purge.chats_completed")
+                    self.log(f"Purged deleted chat {chat_id}: {self.current_deleted} messages "
+                             f"in {time.perf_counter() - started:.1f}s")
+                    return
+                self.current_deleted += deleted
+                metrics.count("purge.messages_deleted", deleted)
+                self.stopped.wait(self.pause)
+        finally:
+            self.current_chat = None
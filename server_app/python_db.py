@@ -1,9 +1,177 @@
-from shared.config import DB_NAME
+from shared.config import DB_NAME, ARCHIVE_DIR, RETENTION_MAX_AGE_DAYS, RETENTION_MAX_MESSAGES
+from .db_pool import ConnectionPool
+from .membership_cache import MembershipCache
+from .metrics import metrics
+from . import archive
+from datetime import datetime, timedelta, timezone
+import os
 import sqlite3
+import re
 import uuid
 
+pool = ConnectionPool(DB_NAME)
+archive_root = os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), ARCHIVE_DIR)
+
+
+def set_database(db_name):
+    # The message archive lives next to the database file.
+    global pool, archive_root
+    pool.close_all()
+    pool = ConnectionPool(db_name)
+    archive_root = os.path.join(os.path.dirname(os.path.abspath(db_name)), ARCHIVE_DIR)
+    membership_cache.clear()
+
+
+def release_connection():
+    pool.release()
+
+
+def set_synchronous(mode):
+    # PRAGMA synchronous of the calling thread's connection only.
+    pool.connection().execute(f"PRAGMA synchronous={mode}")
+
+
+def pool_stats():
+    return pool.stats()
+
+
+# Schema migrations. PRAGMA user_version holds the number of steps already
+# applied, so init_db upgrades existing messenger.db files in place. A step
+# is a list of SQL statements or callables taking the connection.
+MIGRATIONS = [
+    # 1: indexes for the hot read paths
+    [
+        "CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_chat_members_keyword ON chat_members (keyword, chat_id)",
+        "CREATE INDEX IF NOT EXISTS idx_chats_name ON chats (name)",
+    ],
+    # 2: full-text index over message content, kept in sync by triggers
+    [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+               content, content='messages', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2'
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+               INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+               INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+               INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+               INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+           END""",
+        # Backfill: index the messages already in the database.
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ],
+    # 3: retention policies and the index of archived message segments
+    [
+        """CREATE TABLE IF NOT EXISTS chat_retention (
+               chat_id TEXT PRIMARY KEY,
+               max_age_days INTEGER,
+               max_messages INTEGER,
+               FOREIGN KEY (chat_id) REFERENCES chats(id)
+           )""",
+        """CREATE TABLE IF NOT EXISTS archive_segments (
+               path TEXT PRIMARY KEY,
+               chat_id TEXT NOT NULL,
+               first_id INTEGER NOT NULL,
+               last_id INTEGER NOT NULL,
+               count INTEGER NOT NULL
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_archive_segments_chat ON archive_segments (chat_id, last_id)",
+    ],
+    # 4: deleted chats are marked first and purged in the background
+    [
+        "ALTER TABLE chats ADD COLUMN deleted_at DATETIME",
+        "CREATE INDEX IF NOT EXISTS idx_chats_deleted ON chats (deleted_at) WHERE deleted_at IS NOT NULL",
+    ],
+    # 5: per-chat sequence numbers and client message ids for deduplication
+    [
+        "ALTER TABLE messages ADD COLUMN seq INTEGER",
+        "ALTER TABLE messages ADD COLUMN client_msg_id TEXT",
+        "ALTER TABLE chats ADD COLUMN last_seq INTEGER NOT NULL DEFAULT 0",
+        # Backfill: number the live messages of every chat in id order.
+        "CREATE TEMP TABLE message_seq (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL)",
+        """INSERT INTO temp.message_seq (id, seq)
+           SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id) FROM messages""",
+        "UPDATE messages SET seq = (SELECT seq FROM temp.message_seq s WHERE s.id = messages.id)",
+        "DROP TABLE temp.message_seq",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_chat_seq ON messages (chat_id, seq)",
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_client_id
+           ON messages (chat_id, sender, client_msg_id) WHERE client_msg_id IS NOT NULL""",
+        "UPDATE chats SET last_seq = COALESCE((SELECT MAX(seq) FROM messages WHERE chat_id = chats.id), 0)",
+    ],
+]
+
+# Statements on the hot paths. They live here so that
+# tests/test_query_plans.py checks the plans of exactly what runs.
+GET_USER_SQL = "SELECT keyword, nickname, password FROM users WHERE keyword = ?"
+CHAT_BY_NAME_SQL = "SELECT id FROM chats WHERE name = ? AND deleted_at IS NULL"
+USER_CHATS_SQL = """
+    SELECT c.id, c.name
+    FROM chats c
+    JOIN chat_members cm ON c.id = cm.chat_id
+    WHERE cm.keyword = ? AND c.deleted_at IS NULL
+"""
+CHAT_MEMBERS_SQL = "SELECT keyword FROM chat_members WHERE chat_id = ?"
+FIND_CLIENT_MESSAGE_SQL = "SELECT id, seq FROM messages WHERE chat_id = ? AND sender = ? AND client_msg_id = ?"
+CHAT_MESSAGES_SQL = "SELECT sender, content FROM messages WHERE chat_id = ? ORDER BY id"
+MESSAGES_AFTER_SQL = """SELECT id, sender, content, timestamp, seq FROM messages
+                        WHERE chat_id = ? AND id > ? ORDER BY id LIMIT ?"""
+MESSAGES_BEFORE_SQL = """SELECT id, sender, content, timestamp, seq FROM messages
+                         WHERE chat_id = ? AND id < ? ORDER BY id DESC LIMIT ?"""
+LATEST_MESSAGES_SQL = """SELECT id, sender, content, timestamp, seq FROM messages
+                         WHERE chat_id = ? ORDER BY id DESC LIMIT ?"""
+MESSAGES_AFTER_SEQ_SQL = """SELECT id, sender, content, timestamp, seq FROM messages
+                            WHERE chat_id = ? AND seq > ? ORDER BY seq LIMIT ?"""
+SEGMENTS_AFTER_SQL = """SELECT path, first_id, last_id FROM archive_segments
+                        WHERE chat_id = ? AND last_id > ? ORDER BY first_id"""
+SEGMENTS_BEFORE_SQL = """SELECT path, first_id, last_id FROM archive_segments
+                         WHERE chat_id = ? AND first_id < ? ORDER BY last_id DESC"""
+EXPIRY_BY_AGE_SQL = "SELECT id FROM messages WHERE chat_id = ? AND timestamp >= ? ORDER BY id LIMIT 1"
+EXPIRY_BY_COUNT_SQL = "SELECT id FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?"
+NEXT_MESSAGE_ID_SQL = "SELECT MAX(id) + 1 FROM messages WHERE chat_id = ?"
+OLDEST_MESSAGES_SQL = """SELECT id, sender, content, timestamp, seq FROM messages
+                         WHERE chat_id = ? AND id < ? ORDER BY id LIMIT ?"""
+DELETE_ARCHIVED_SQL = "DELETE FROM messages WHERE chat_id = ? AND id BETWEEN ? AND ?"
+PURGE_MESSAGES_SQL = """DELETE FROM messages WHERE id IN (
+                            SELECT id FROM messages WHERE chat_id = ? ORDER BY id LIMIT ?
+                        )"""
+_SEARCH_SQL = """SELECT m.id, m.chat_id, m.sender, m.content, m.timestamp,
+                        snippet(messages_fts, 0, '[', ']', '...', 12)
+                 FROM messages_fts
+                 JOIN messages m ON m.id = messages_fts.rowid
+                 JOIN chat_members cm ON cm.chat_id = m.chat_id AND cm.keyword = ?
+                 WHERE messages_fts MATCH ?"""
+_SEARCH_ORDER_SQL = " ORDER BY bm25(messages_fts), m.id DESC LIMIT ? OFFSET ?"
+SEARCH_SQL = _SEARCH_SQL + _SEARCH_ORDER_SQL
+SEARCH_IN_CHAT_SQL = _SEARCH_SQL + " AND m.chat_id = ?" + _SEARCH_ORDER_SQL
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_schema_version(conn)
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return version
+            for step in MIGRATIONS[version]:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    conn = pool.connection()
     cursor = conn.cursor()
 
     # Users table
@@ -47,10 +215,12 @@ def init_db():
     """)
 
     conn.commit()
-    conn.close()
+    migrate(conn)
 
+@metrics.timed("db.add_user")
 def add_user(keyword, nickname, password):
-    with sqlite3.connect(DB_NAME) as conn:
+    conn = pool.connection()
+    with conn:
         try:
             conn.execute(
                 "INSERT INTO users (keyword, nickname, password) VALUES (?, ?, ?)",
@@ -60,75 +230,419 @@ def add_user(keyword, nickname, password):
         except sqlite3.IntegrityError:
             return False
 
+@metrics.timed("db.get_user")
 def get_user(keyword):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.execute(
-            "SELECT keyword, nickname, password FROM users WHERE keyword = ?",
-            (keyword,)
-        )
-        return cur.fetchone()
+    conn = pool.connection()
+    cur = conn.execute(GET_USER_SQL, (keyword,))
+    return cur.fetchone()
 
+# Keeps IN (...) lists well below SQLite's bound-parameter limit.
+SQL_VARIABLE_CHUNK = 500
+
+@metrics.timed("db.get_existing_users")
+def get_existing_users(keywords):
+    keywords = list(dict.fromkeys(keywords))
+    conn = pool.connection()
+    existing = set()
+    for start in range(0, len(keywords), SQL_VARIABLE_CHUNK):
+        chunk = keywords[start:start + SQL_VARIABLE_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        cur = conn.execute(f"SELECT keyword FROM users WHERE keyword IN ({placeholders})", chunk)
+        existing.update(row[0] for row in cur)
+    return existing
+
+@metrics.timed("db.create_chat")
 def create_chat(name, members):
     chat_id = str(uuid.uuid4())
-    with sqlite3.connect(DB_NAME) as conn:
+    conn = pool.connection()
+    with conn:
         conn.execute("INSERT INTO chats (id, name) VALUES (?, ?)", (chat_id, name))
-        for member in members:
-            conn.execute(
-                "INSERT INTO chat_members (chat_id, keyword) VALUES (?, ?)",
-                (chat_id, member)
-            )
+        conn.executemany(
+            "INSERT INTO chat_members (chat_id, keyword) VALUES (?, ?)",
+            [(chat_id, member) for member in members]
+        )
+    membership_cache.invalidate(chat_id)
     return chat_id
 
+@metrics.timed("db.get_chat")
+def get_chat(chat_id):
+    conn = pool.connection()
+    cur = conn.execute("SELECT id, name FROM chats WHERE id = ? AND deleted_at IS NULL", (chat_id,))
+    return cur.fetchone()
+
+@metrics.timed("db.rename_chat")
+def rename_chat(chat_id, name):
+    conn = pool.connection()
+    with conn:
+        conn.execute("UPDATE chats SET name = ? WHERE id = ?", (name, chat_id))
+
+@metrics.timed("db.get_chat_by_name")
+def get_chat_by_name(name):
+    conn = pool.connection()
+    cur = conn.execute(CHAT_BY_NAME_SQL, (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+@metrics.timed("db.get_user_chats")
 def get_user_chats(keyword):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.execute("""
-            SELECT c.id, c.name
-            FROM chats c
-            JOIN chat_members cm ON c.id = cm.chat_id
-            WHERE cm.keyword = ?
-        """, (keyword,))
-        return cur.fetchall()
+    conn = pool.connection()
+    cur = conn.execute(USER_CHATS_SQL, (keyword,))
+    return cur.fetchall()
+
+def current_timestamp():
+    # Same format and zone as SQLite's CURRENT_TIMESTAMP.
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
 def add_message(chat_id, sender, content):
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.execute(
-            "INSERT INTO messages (chat_id, sender, content) VALUES (?, ?, ?)",
-            (chat_id, sender, content)
-        )
+    return add_messages([(chat_id, sender, content, current_timestamp(), None)])[0][0]
+
+@metrics.timed("db.add_messages")
+def add_messages(rows):
+    # rows: [(chat_id, sender, content, timestamp, client_msg_id), ...] written
+    # in one transaction. Returns [(id, seq, duplicate), ...] in row order.
+    # A row whose client_msg_id its sender already used in the chat (a resend
+    # after a reconnect) is not stored again and gets the original's id and
+    # seq. seq numbers a chat's messages 1, 2, 3, ...; chats.last_seq is the
+    # counter. The transaction takes the write lock up front, so the
+    # duplicate check and the counters hold across processes, and
+    # AUTOINCREMENT ids are consecutive and can be recovered from the last one.
+    conn = pool.connection()
+    results = [None] * len(rows)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        fresh = []     # indexes of the rows to insert
+        claimed = {}   # (chat_id, sender, client_msg_id) -> index of the row storing it
+        repeats = []   # (index, index of the row it repeats) within this batch
+        for index, (chat_id, sender, _, _, client_msg_id) in enumerate(rows):
+            if client_msg_id is not None:
+                key = (chat_id, sender, client_msg_id)
+                if key in claimed:
+                    repeats.append((index, claimed[key]))
+                    continue
+                row = conn.execute(FIND_CLIENT_MESSAGE_SQL, key).fetchone()
+                if row is not None:
+                    results[index] = (row[0], row[1], True)
+                    continue
+                claimed[key] = index
+            fresh.append(index)
+
+        counts = {}
+        for index in fresh:
+            counts[rows[index][0]] = counts.get(rows[index][0], 0) + 1
+        next_seq = {}
+        for chat_id, count in counts.items():
+            conn.execute("UPDATE chats SET last_seq = last_seq + ? WHERE id = ?", (count, chat_id))
+            row = conn.execute("SELECT last_seq FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            next_seq[chat_id] = row[0] - count + 1 if row else None
+
+        values = []
+        for index in fresh:
+            chat_id, sender, content, timestamp, client_msg_id = rows[index]
+            seq = next_seq[chat_id]
+            if seq is not None:
+                next_seq[chat_id] = seq + 1
+            values.append((chat_id, sender, content, timestamp, seq, client_msg_id))
+        if values:
+            conn.executemany(
+                """INSERT INTO messages (chat_id, sender, content, timestamp, seq, client_msg_id)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                values
+            )
+            first_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0] - len(values) + 1
+            for offset, index in enumerate(fresh):
+                results[index] = (first_id + offset, values[offset][4], False)
+    for index, original in repeats:
+        results[index] = (results[original][0], results[original][1], True)
+    return results
 
+@metrics.timed("db.get_chat_messages")
 def get_chat_messages(chat_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.execute(
-            "SELECT sender, content FROM messages WHERE chat_id = ? ORDER BY id",
-            (chat_id,)
+    archived = [(row[1], row[2]) for row in archived_messages(chat_id)]
+    conn = pool.connection()
+    cur = conn.execute(CHAT_MESSAGES_SQL, (chat_id,))
+    return archived + cur.fetchall()
+
+@metrics.timed("db.get_chat_messages_page")
+def get_chat_messages_page(chat_id, before_id=None, after_id=None, limit=50):
+    # Returns (rows, has_more) with rows (id, sender, content, timestamp, seq)
+    # in id order. With after_id the page runs forward from that cursor,
+    # otherwise it is the newest `limit` rows older than before_id (or the
+    # newest rows of the chat when no cursor is given). Archived messages are
+    # older than every live one and continue the page where the table ends.
+    conn = pool.connection()
+    if after_id is not None:
+        rows = archived_messages(chat_id, after_id=after_id, limit=limit + 1)
+        if len(rows) <= limit:
+            cur = conn.execute(
+                MESSAGES_AFTER_SQL, (chat_id, rows[-1][0] if rows else after_id, limit + 1 - len(rows))
+            )
+            rows += cur.fetchall()
+        return rows[:limit], len(rows) > limit
+
+    if before_id is not None:
+        cur = conn.execute(MESSAGES_BEFORE_SQL, (chat_id, before_id, limit + 1))
+    else:
+        cur = conn.execute(LATEST_MESSAGES_SQL, (chat_id, limit + 1))
+    rows = cur.fetchall()[::-1]
+    if len(rows) <= limit:
+        rows = archived_messages(
+            chat_id, before_id=rows[0][0] if rows else before_id, limit=limit + 1 - len(rows)
+        ) + rows
+    has_more = len(rows) > limit
+    return rows[-limit:], has_more
+
+@metrics.timed("db.get_messages_after_seq")
+def get_messages_after_seq(chat_id, after_seq, limit):
+    # The chat's messages numbered after after_seq, for a client catching up
+    # after a reconnect: (rows, has_more) with rows as in
+    # get_chat_messages_page. Only live rows; whatever retention archived
+    # meanwhile is reachable through the history pages.
+    conn = pool.connection()
+    rows = conn.execute(MESSAGES_AFTER_SEQ_SQL, (chat_id, after_seq, limit + 1)).fetchall()
+    return rows[:limit], len(rows) > limit
+
+def archived_messages(chat_id, before_id=None, after_id=None, limit=None):
+    # Rows (id, sender, content, timestamp, seq) from the archive in id order:
+    # the `limit` oldest after after_id, or the `limit` newest before
+    # before_id (all of them without a limit).
+    conn = pool.connection()
+    if after_id is not None:
+        segments = conn.execute(SEGMENTS_AFTER_SQL, (chat_id, after_id)).fetchall()
+    else:
+        segments = conn.execute(
+            SEGMENTS_BEFORE_SQL, (chat_id, before_id if before_id is not None else 2 ** 63 - 1)
+        ).fetchall()
+    found = {}
+    for path, first_id, last_id in segments:
+        # Segments can overlap, so stop only once the next one cannot hold
+        # anything closer to the cursor than what is already collected.
+        if limit is not None and len(found) >= limit:
+            edge = sorted(found)[limit - 1] if after_id is not None else sorted(found)[-limit]
+            if (after_id is not None and first_id > edge) or (after_id is None and last_id < edge):
+                break
+        for row in archive.read_segment(os.path.join(archive_root, path)):
+            if (after_id is None or row[0] > after_id) and (before_id is None or row[0] < before_id):
+                found[row[0]] = row
+    ids = sorted(found)
+    if limit is not None:
+        ids = ids[:limit] if after_id is not None else ids[max(0, len(ids) - limit):]
+    return [found[mid] for mid in ids]
+
+def get_retention_policy(chat_id):
+    conn = pool.connection()
+    row = conn.execute(
+        "SELECT max_age_days, max_messages FROM chat_retention WHERE chat_id = ?", (chat_id,)
+    ).fetchone()
+    return row or (None, None)
+
+def set_retention_policy(chat_id, max_age_days, max_messages):
+    # None for both falls back to the global policy.
+    conn = pool.connection()
+    with conn:
+        if max_age_days is None and max_messages is None:
+            conn.execute("DELETE FROM chat_retention WHERE chat_id = ?", (chat_id,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_retention (chat_id, max_age_days, max_messages) VALUES (?, ?, ?)",
+                (chat_id, max_age_days, max_messages)
+            )
+
+def retention_policies():
+    # [(chat_id, max_age_days, max_messages)] for every chat a policy applies
+    # to; per-chat values override the global ones field by field.
+    conn = pool.connection()
+    if RETENTION_MAX_AGE_DAYS is None and RETENTION_MAX_MESSAGES is None:
+        rows = conn.execute("SELECT chat_id, max_age_days, max_messages FROM chat_retention").fetchall()
+    else:
+        rows = conn.execute(
+            """SELECT c.id, r.max_age_days, r.max_messages FROM chats c
+               LEFT JOIN chat_retention r ON r.chat_id = c.id
+               WHERE c.deleted_at IS NULL"""
+        ).fetchall()
+    return [
+        (chat_id,
+         age if age is not None else RETENTION_MAX_AGE_DAYS,
+         count if count is not None else RETENTION_MAX_MESSAGES)
+        for chat_id, age, count in rows
+    ]
+
+def expiry_boundary(chat_id, max_age_days=None, max_messages=None):
+    # Messages of the chat with id below the returned id are past the
+    # policy (None: nothing is). Ids grow with time, so both limits cut the
+    # chat at one id and the scans only walk the index up to that point.
+    conn = pool.connection()
+    boundary = None
+    if max_age_days is not None:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        row = conn.execute(EXPIRY_BY_AGE_SQL, (chat_id, cutoff)).fetchone()
+        if row is None:
+            row = conn.execute(NEXT_MESSAGE_ID_SQL, (chat_id,)).fetchone()
+        boundary = row[0]
+    if max_messages is not None:
+        if max_messages > 0:
+            # The oldest message that is still kept.
+            row = conn.execute(EXPIRY_BY_COUNT_SQL, (chat_id, max_messages - 1)).fetchone()
+        else:
+            row = conn.execute(NEXT_MESSAGE_ID_SQL, (chat_id,)).fetchone()
+        if row is not None and row[0] is not None:
+            boundary = max(boundary or 0, row[0])
+    return boundary
+
+@metrics.timed("db.archive_oldest_messages")
+def archive_oldest_messages(chat_id, boundary, limit):
+    # Moves up to `limit` of the chat's oldest messages below `boundary` into
+    # archive segments (one per month), then deletes them in one short
+    # transaction. Returns how many were archived.
+    conn = pool.connection()
+    rows = conn.execute(OLDEST_MESSAGES_SQL, (chat_id, boundary, limit)).fetchall()
+    if not rows:
+        return 0
+
+    months = {}
+    for row in rows:
+        months.setdefault(str(row[3])[:7], []).append(row)
+    segments = []
+    for month, month_rows in months.items():
+        path = archive.segment_name(chat_id, month, month_rows[0][0])
+        archive.write_segment(os.path.join(archive_root, path), month_rows)
+        segments.append((path, chat_id, month_rows[0][0], month_rows[-1][0], len(month_rows)))
+
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO archive_segments (path, chat_id, first_id, last_id, count) VALUES (?, ?, ?, ?, ?)",
+            segments
         )
-        return cur.fetchall()
+        conn.execute(DELETE_ARCHIVED_SQL, (chat_id, rows[0][0], rows[-1][0]))
+    return len(rows)
+
+def incremental_vacuum(pages):
+    # Frees up to `pages` pages; returns how many free pages remain, or None
+    # when the database was not created with incremental auto-vacuum.
+    conn = pool.connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return None
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+SEARCH_MAX_TERMS = 8
+
+def build_search_query(text):
+    # Turns free user input into a safe FTS5 query: every word becomes a
+    # quoted phrase (so operators and column filters are not interpreted),
+    # words are ANDed and the last one matches as a prefix.
+    terms = re.findall(r"\w+", text or "")[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+@metrics.timed("db.search_messages")
+def search_messages(keyword, text, chat_id=None, limit=20, offset=0):
+    # Returns (rows, has_more) with rows (id, chat_id, sender, content,
+    # timestamp, snippet) best match first, limited to chats `keyword` is in.
+    query = build_search_query(text)
+    if query is None:
+        return [], False
+    if chat_id is None:
+        sql, params = SEARCH_SQL, (keyword, query, limit + 1, offset)
+    else:
+        sql, params = SEARCH_IN_CHAT_SQL, (keyword, query, chat_id, limit + 1, offset)
+    conn = pool.connection()
+    rows = conn.execute(sql, params).fetchall()
+    return rows[:limit], len(rows) > limit
+
+@metrics.timed("db.load_chat_members")
+def load_chat_members(chat_id):
+    conn = pool.connection()
+    cur = conn.execute(CHAT_MEMBERS_SQL, (chat_id,))
+    return set(row[0] for row in cur.fetchall())
+
+membership_cache = MembershipCache(load_chat_members)
 
 def get_chat_members(chat_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.execute(
-            "SELECT keyword FROM chat_members WHERE chat_id = ?",
-            (chat_id,)
-        )
-        return set(row[0] for row in cur.fetchall())
+    # Cached; the mutations below keep the cache in step with the table.
+    return membership_cache.get(chat_id)
 
+@metrics.timed("db.add_users_to_chat")
 def add_users_to_chat(chat_id, users):
-    with sqlite3.connect(DB_NAME) as conn:
-        for user in users:
-            conn.execute(
-                "INSERT OR IGNORE INTO chat_members (chat_id, keyword) VALUES (?, ?)",
-                (chat_id, user)
-            )
+    conn = pool.connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO chat_members (chat_id, keyword) VALUES (?, ?)",
+            [(chat_id, user) for user in users]
+        )
+    membership_cache.add_members(chat_id, users)
+
+@metrics.timed("db.add_users_to_chat_bulk")
+def add_users_to_chat_bulk(chat_id, keywords):
+    # Validates and inserts all keywords in one transaction. Returns
+    # {keyword: "added" | "already_member" | "unknown_user"}.
+    keywords = list(dict.fromkeys(keywords))
+    existing = get_existing_users(keywords)
+    conn = pool.connection()
+    with conn:
+        cur = conn.execute(CHAT_MEMBERS_SQL, (chat_id,))
+        current = set(row[0] for row in cur)
+        results = {}
+        for keyword in keywords:
+            if keyword not in existing:
+                results[keyword] = "unknown_user"
+            elif keyword in current:
+                results[keyword] = "already_member"
+            else:
+                results[keyword] = "added"
+        added = [k for k, result in results.items() if result == "added"]
+        conn.executemany(
+            "INSERT OR IGNORE INTO chat_members (chat_id, keyword) VALUES (?, ?)",
+            [(chat_id, keyword) for keyword in added]
+        )
+    membership_cache.add_members(chat_id, added)
+    return results
 
+@metrics.timed("db.remove_user_from_chat")
 def remove_user_from_chat(chat_id, keyword):
-    with sqlite3.connect(DB_NAME) as conn:
+    conn = pool.connection()
+    with conn:
         conn.execute(
             "DELETE FROM chat_members WHERE chat_id = ? AND keyword = ?",
             (chat_id, keyword)
         )
+    membership_cache.remove_member(chat_id, keyword)
 
+@metrics.timed("db.delete_chat")
 def delete_chat(chat_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+    # Only marks the chat: it vanishes from every listing and loses its
+    # members at once, while its messages are left for purge_deleted_chat,
+    # so a big chat never holds the write lock for long.
+    conn = pool.connection()
+    with conn:
+        conn.execute(
+            "UPDATE chats SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL",
+            (current_timestamp(), chat_id)
+        )
         conn.execute("DELETE FROM chat_members WHERE chat_id = ?", (chat_id,))
-        conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+        conn.execute("DELETE FROM chat_retention WHERE chat_id = ?", (chat_id,))
+    membership_cache.invalidate(chat_id)
+
+def deleted_chats():
+    conn = pool.connection()
+    cur = conn.execute("SELECT id FROM chats WHERE deleted_at IS NOT NULL ORDER BY deleted_at")
+    return [row[0] for row in cur.fetchall()]
+
+@metrics.timed("db.purge_deleted_chat")
+def purge_deleted_chat(chat_id, limit):
+    # Deletes up to `limit` messages of a deleted chat and returns how many
+    # went. Once none are left its archive and then the chat row go too;
+    # the archive first, so a failure there leaves the chat for a later pass.
+    conn = pool.connection()
+    with conn:
+        cur = conn.execute(PURGE_MESSAGES_SQL, (chat_id, limit))
+        deleted = cur.rowcount
+    if deleted:
+        return deleted
+    archive.remove_chat(archive_root, chat_id)
+    with conn:
+        conn.execute("DELETE FROM archive_segments WHERE chat_id = ?", (chat_id,))
+        conn.execute("DELETE FROM chats WHERE id = ? AND deleted_at IS NOT NULL", (chat_id,))
+    return 0
@@ -0,0 +1,115 @@
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+from shared.config import (
+    DB_NAME, RETENTION_INTERVAL, RETENTION_BATCH, RETENTION_PAUSE, RETENTION_VACUUM_PAGES
+)
+from .logs import LoggingSink
+from .python_db import (
+    init_db, set_database, retention_policies, expiry_boundary, archive_oldest_messages,
+    incremental_vacuum, release_connection
+)
+
+
+class RetentionWorker:
+    # Background pass that moves messages past their chat's retention
+    # policy into the archive and then returns freed pages to the OS. Every
+    # batch is its own short transaction followed by a pause, so live writes
+    # never queue behind the pass for longer than one batch.
+    def __init__(self, log, interval=RETENTION_INTERVAL, batch_size=RETENTION_BATCH, pause=RETENTION_PAUSE):
+        self.log = log
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.stopped = threading.Event()
+        self.thread = None
+        self.passes = 0
+        self.archived = 0
+        self.last_pass_seconds = 0.0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.stopped.set()
+        self.thread.join(timeout=10)
+        self.thread = None
+
+    def stats(self):
+        return {
+            "passes": self.passes,
+            "archived_messages": self.archived,
+            "last_pass_seconds": round(self.last_pass_seconds, 3),
+        }
+
+    def _run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    self.run_once()
+                except (sqlite3.Error, OSError) as e:
+                    # e.g. the archive disk is full; the rows stay in the
+                    # database and the next pass tries again.
+                    self.log(f"Retention pass failed: {e}")
+        finally:
+            release_connection()
+
+    def run_once(self):
+        started = time.perf_counter()
+        archived = 0
+        for chat_id, max_age_days, max_messages in retention_policies():
+            boundary = expiry_boundary(chat_id, max_age_days, max_messages)
+            while boundary is not None and not self.stopped.is_set():
+                moved = archive_oldest_messages(chat_id, boundary, self.batch_size)
+                archived += moved
+                if moved < self.batch_size:
+                    break
+                self.stopped.wait(self.pause)
+        self.vacuum()
+        self.passes += 1
+        self.archived += archived
+        self.last_pass_seconds = time.perf_counter() - started
+        if archived:
+            self.log(f"Retention archived {archived} messages in {self.last_pass_seconds:.1f}s")
+        return archived
+
+    def vacuum(self):
+        while not self.stopped.is_set():
+            remaining = incremental_vacuum(RETENTION_VACUUM_PAGES)
+            if not remaining:
+                return
+            self.stopped.wait(self.pause)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run message retention against a database")
+    parser.add_argument("--db", default=DB_NAME, help="SQLite database file")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Switch an existing database to incremental auto-vacuum (full VACUUM; run offline)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s")
+
+    set_database(args.db)
+    init_db()
+    log = LoggingSink()
+    if args.vacuum:
+        conn = sqlite3.connect(args.db)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.close()
+        log("Database rebuilt with incremental auto-vacuum")
+    archived = RetentionWorker(log, pause=0).run_once()
+    log(f"Retention pass done, {archived} messages archived")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,840 @@
+import socket
+import threading
+import errno
+import time
+from .async_engine import AsyncServerEngine
+from .logs import LogHub
+from .sessions import SessionRegistry
+from .outbound import OutboundMetrics, SocketConnection
+from .chat_list_sync import ChatListVersions
+from .message_writer import MessageWriter
+from .metrics import metrics, MetricsHttpServer, MetricsFileDumper, SIZE_BUCKETS
+from .profiling import Profiler
+from .retention import RetentionWorker
+from .purger import ChatPurger
+from .presence import PresenceTracker
+from shared.config import (
+    HOST, PORT, BUFFER_SIZE, SERVER_ENGINE, HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE,
+    SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE, RESUME_MAX_CHATS, RESUME_MAX_MESSAGES, RESUME_MAX_TEXT, METRICS_PORT, METRICS_FILE, METRICS_INTERVAL,
+    ADMIN_KEYWORDS, PROFILE_DEFAULT_SECONDS
+)
+from shared.protocol import FrameDecoder, FrameError, encode_frame, constant_frame, decode_payload
+from shared.codec import negotiate
+from .python_db import (
+    add_user, get_user, create_chat, get_user_chats,
+    get_chat_messages, get_chat_messages_page, get_messages_after_seq, get_chat_members, current_timestamp,
+    search_messages,
+    add_users_to_chat, add_users_to_chat_bulk, get_existing_users,
+    remove_user_from_chat, delete_chat,
+    get_chat, rename_chat, get_chat_by_name, release_connection,
+    membership_cache, pool_stats, add_messages, get_retention_policy, set_retention_policy
+)
+
+# Windows reports socket errors with WSA* codes; fall back to POSIX ones.
+ENOTSOCK = getattr(errno, "WSAENOTSOCK", errno.ENOTSOCK)
+ECONNRESET = getattr(errno, "WSAECONNRESET", errno.ECONNRESET)
+
+# Fields several actions share, checked once in dispatch_request: a chat id
+# that is not a str (a list, say) would otherwise reach the membership
+# cache as an unhashable key. chat_id may be left out or null; member lists
+# may be left out.
+STR_FIELDS = ("chat_id",)
+STR_LIST_FIELDS = ("members", "users")
+
+
+def invalid_field(request):
+    for field in STR_FIELDS:
+        value = request.get(field)
+        if value is not None and not isinstance(value, str):
+            return field
+    for field in STR_LIST_FIELDS:
+        if field in request:
+            value = request[field]
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                return field
+    return None
+
+
+class ServerApp:
+    def __init__(self, engine=SERVER_ENGINE, host=HOST, port=PORT, reuse_port=False,
+                 metrics_port=METRICS_PORT, metrics_file=METRICS_FILE, run_maintenance=True):
+        self.running = False
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.async_engine = None
+        self.accept_thread = None
+        self.clients = []
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.log = LogHub()
+        self.sessions = SessionRegistry()
+        # Connection and request_id of the request this thread is handling.
+        self.request_context = threading.local()
+        self.chat_list_versions = ChatListVersions()
+        self.presence = PresenceTracker(self.sessions, self.log)
+        self.sessions.on_presence = self.presence.user_presence_changed
+        self.outbound_metrics = OutboundMetrics()
+        self.profiler = Profiler(self.log)
+        self.message_writer = MessageWriter(insert_batch=lambda rows: self.profiler.call(add_messages, rows))
+        self.cluster = None  # WorkerBus when running as one shard of a cluster
+        # Background maintenance (retention, purging deleted chats); in a
+        # cluster only one shard runs it.
+        self.retention = RetentionWorker(self.log) if run_maintenance else None
+        self.purger = ChatPurger(self.log) if run_maintenance else None
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_http = None
+        self.metrics_dumper = None
+
+    def toggle_server(self):
+        if self.running:
+            self.stop_server()
+        else:
+            self.start_server()
+
+    def start_server(self):
+        if self.running:
+            self.log("Server is already running.")
+            return True
+
+        try:
+            self.message_writer.start()
+            if self.engine == "asyncio":
+                self.async_engine = AsyncServerEngine(self, self.host, self.port, reuse_port=self.reuse_port)
+                self.async_engine.start()
+                self.running = True
+            else:
+                self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.reuse_port:
+                    self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                self.server_socket.bind((self.host, self.port))
+                self.server_socket.listen()
+                self.running = True
+                self.accept_thread = threading.Thread(target=self.accept_clients, daemon=True)
+                self.accept_thread.start()
+
+            self.log(f"✅ Server started on {self.host}:{self.port} ({self.engine} engine)")
+            self.presence.start()
+            self.start_metrics()
+            if self.retention:
+                self.retention.start()
+            if self.purger:
+                self.purger.start()
+            return True
+        except Exception as e:
+            self.message_writer.stop()
+            self.log(f"❌ Failed to start server: {e}")
+            return False
+
+    def stop_server(self):
+        self.running = False
+        self.log("🛑 Server stopping...")
+
+        # Close all client sockets
+        for client in list(self.clients):
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+                client.close()
+            except Exception:
+                pass
+        self.clients.clear()
+
+        # Close the server socket
+        if self.async_engine:
+            self.async_engine.stop()
+            self.async_engine = None
+        try:
+            self.server_socket.close()
+        except Exception:
+            pass
+        self.message_writer.stop()
+        self.presence.stop()
+        if self.retention:
+            self.retention.stop()
+        if self.purger:
+            self.purger.stop()
+        self.stop_metrics()
+        self.profiler.stop()
+
+        self.log("✅ Server stopped.")
+
+    def accept_clients(self):
+        while self.running:
+            try:
+                client_socket, addr = self.server_socket.accept()
+            except OSError:
+                break  # Server was stopped, socket closed
+
+            if not self.running:
+                client_socket.close()
+                break
+
+            client = SocketConnection(client_socket, addr, metrics=self.outbound_metrics)
+            self.clients.append(client)
+            self.log(f"Client connected from {addr}")
+            threading.Thread(target=self.handle_client, args=(client,), daemon=True).start()
+
+    def handle_client(self, client_socket):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                try:
+                    data = client_socket.recv(BUFFER_SIZE)
+                except OSError as e:
+                    if e.errno == ENOTSOCK:
+                        break  # Client socket already closed
+                    raise  # Reraise others
+                if not data:
+                    break
+
+                try:
+                    payloads = decoder.feed_payloads(data)
+                except FrameError as e:
+                    self.log(f"Dropping client after bad frame: {e}")
+                    break
+
+                for payload in payloads:
+                    self.dispatch_payload(client_socket, payload)
+
+        except Exception as e:
+            if isinstance(e, ConnectionResetError) or (hasattr(e, 'errno') and e.errno == ECONNRESET):
+                self.log("Client closed the connection unexpectedly.")
+            elif isinstance(e, OSError) and e.errno == ENOTSOCK:
+                self.log("Client socket was already closed.")
+            else:
+                self.log(f"Client error: {e}")
+        finally:
+            self.disconnect_client(client_socket)
+            release_connection()
+            try:
+                client_socket.close()
+            except Exception:
+                pass
+
+    def disconnect_client(self, client_socket):
+        try:
+            self.clients.remove(client_socket)
+        except ValueError:
+            pass
+        self.presence.forget(client_socket)
+        keyword = self.sessions.logout(client_socket)
+        if keyword:
+            self.log(f"User disconnected: @{keyword}")
+
+    def dispatch_payload(self, client_socket, payload):
+        # An oversized frame loses the framing and drops the client (see the
+        # engines); a frame that arrived whole but does not decode only
+        # fails itself.
+        try:
+            request = decode_payload(payload)
+        except ValueError as e:
+            metrics.count("action_errors.malformed")
+            self.send_response(client_socket, {"status": "error", "message": f"Malformed request: {e}"})
+            return
+        self.dispatch(client_socket, request)
+
+    def dispatch(self, client_socket, request):
+        if self.profiler.active:
+            return self.profiler.call(self.dispatch_request, client_socket, request)
+        return self.dispatch_request(client_socket, request)
+
+    def dispatch_request(self, client_socket, request):
+        action = request.get("action")
+        username = self.sessions.get(client_socket)
+
+        # Replies echo the client's request_id (a number or short string),
+        # so a client can pipeline requests and match replies to them.
+        request_id = request.get("request_id")
+        if not isinstance(request_id, (int, str)) or isinstance(request_id, bool) or len(str(request_id)) > 64:
+            request_id = None
+        self.request_context.conn = client_socket
+        self.request_context.request_id = request_id
+
+        # Per-action latency; unknown actions share one name so clients
+        # cannot grow the metrics without bound.
+        name = action
+        started = time.perf_counter()
+        try:
+            field = invalid_field(request)
+            if field:
+                name = "invalid"
+                self.send_response(client_socket, {"status": "error", "message": f"Invalid field: {field}"})
+                return
+            match action:
+                case "hello":
+                    self.handle_hello(client_socket, request)
+                case "register":
+                    self.handle_register(client_socket, request)
+                case "login":
+                    self.handle_login(client_socket, request)
+                case "send_message":
+                    self.handle_send_message(client_socket, request)
+                case "get_chats":
+                    self.handle_get_chats(client_socket, request)
+                case "create_chat":
+                    self.handle_create_chat(client_socket, request)
+                case "add_users_to_chat":
+                    self.handle_add_users_to_chat(client_socket, request, username)
+                case "leave_chat":
+                    self.handle_leave_chat(client_socket, request, username)
+                case "delete_chat":
+                    self.handle_delete_chat(client_socket, request, username)
+                case "rename_chat":
+                    self.handle_rename_chat(client_socket, request, username)
+                case "get_chat_messages":
+                    self.handle_get_chat_messages(client_socket, request, username)
+                case "resume":
+                    self.handle_resume(client_socket, request, username)
+                case "search_messages":
+                    self.handle_search_messages(client_socket, request, username)
+                case "set_retention":
+                    self.handle_set_retention(client_socket, request, username)
+                case "profile":
+                    self.handle_profile(client_socket, request, username)
+                case "watch_chat":
+                    self.handle_watch_chat(client_socket, request, username)
+                case "typing":
+                    self.handle_typing(client_socket, request, username)
+                case _:
+                    name = "unknown"
+                    self.send_response(client_socket, {"status": "error", "message": "Unknown action"})
+        except Exception:
+            metrics.count(f"action_errors.{name}")
+            raise
+        finally:
+            self.request_context.conn = None
+            metrics.observe(f"action.{name}", (time.perf_counter() - started) * 1000)
+
+    # ========================
+    #        HANDLERS
+    # ========================
+
+    def handle_hello(self, client_socket, data):
+        # The reply still goes out in JSON; everything after it uses the
+        # negotiated codec. Incoming frames are decoded whatever they use.
+        try:
+            codec = negotiate(data.get("codecs"))
+        except ValueError as e:
+            self.send_response(client_socket, {"status": "error", "message": str(e)})
+            return
+        reply = {"action": "hello", "status": "ok", "codec": codec.name}
+        if self.request_context.request_id is None:
+            client_socket.send(constant_frame(f"hello:{codec.name}", reply))
+        else:
+            client_socket.send(encode_frame(dict(reply, request_id=self.request_context.request_id)))
+        client_socket.codec = codec
+
+    def handle_register(self, client_socket, data):
+        keyword = data.get("keyword")
+        nickname = data.get("nickname")
+        password = data.get("password")
+
+        if not keyword or not nickname or not password:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        success = add_user(keyword, nickname, password)
+        if success:
+            group_chat_id = self.get_or_create_default_chat("Group Chat")
+            add_users_to_chat(group_chat_id, [keyword])
+            self.log(f"New user registered: @{keyword} ({nickname})")
+            self.send_response(client_socket, {"status": "ok"})
+        else:
+            self.send_response(client_socket, {"status": "error", "message": "Keyword already taken"})
+
+    def handle_login(self, client_socket, data):
+        keyword = data.get("keyword")
+        password = data.get("password")
+
+        user = get_user(keyword)
+        if user and user[2] == password:
+            self.sessions.login(client_socket, keyword)
+            self.log(f"User logged in: @{keyword}")
+            self.send_response(client_socket, {"status": "ok", "nickname": user[1]})
+        else:
+            self.send_response(client_socket, {"status": "error", "message": "Invalid credentials"})
+
+    def handle_send_message(self, client_socket, data):
+        keyword = self.sessions.get(client_socket)
+        chat_id = data.get("chat_id")
+        message = data.get("message")
+
+        if not keyword or not chat_id or not message:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+        # Checked here rather than left to the insert, which would fail the
+        # whole group-commit batch the message lands in. chat_id is checked
+        # in dispatch_request.
+        if not isinstance(message, str):
+            self.send_response(client_socket, {"status": "error", "message": "Invalid fields"})
+            return
+
+        members = get_chat_members(chat_id)
+        if keyword not in members:
+            self.send_response(client_socket, {"status": "error", "message": "Not a member of this chat"})
+            return
+
+        # Optional id chosen by the client, so a message resent after a
+        # reconnect is stored and delivered once.
+        client_msg_id = data.get("client_msg_id")
+        if client_msg_id is not None:
+            client_msg_id = str(client_msg_id)[:64]
+
+        if self.presence.typing_stopped(chat_id, keyword) and self.cluster:
+            self.cluster.typing(chat_id, keyword, False)
+
+        timestamp = current_timestamp()
+        message_id, seq, duplicate = self.message_writer.write(chat_id, keyword, message, timestamp, client_msg_id)
+        self.send_response(client_socket, {
+            "action": "message_ack",
+            "chat_id": chat_id,
+            "client_msg_id": client_msg_id,
+            "id": message_id,
+            "seq": seq,
+            "duplicate": duplicate
+        })
+        if duplicate:
+            metrics.count("messages.duplicates")
+            return
+
+        response = {
+            "action": "new_message",
+            "chat_id": chat_id,
+            "id": message_id,
+            "seq": seq,
+            "timestamp": timestamp,
+            "from": keyword,
+            "message": message
+        }
+        self.broadcast_to_chat(chat_id, response, members)
+
+    def handle_get_chats(self, client_socket, _):
+        keyword = self.sessions.get(client_socket)
+        if not keyword:
+            self.send_response(client_socket, {"status": "error", "message": "Not logged in"})
+            return
+
+        # Read the version first: a delta racing with the query is then
+        # either reflected in the list or has a higher version.
+        if self.cluster:
+            version = self.cluster.chat_list_version(keyword)
+        else:
+            version = self.chat_list_versions.current(keyword)
+        chats = get_user_chats(keyword)
+        chat_list = [{"id": cid, "name": name} for cid, name in chats]
+        self.send_response(client_socket, {"status": "ok", "chats": chat_list, "version": version})
+
+    def handle_create_chat(self, client_socket, data):
+        keyword = self.sessions.get(client_socket)
+        if not keyword:
+            self.send_response(client_socket, {"status": "error", "message": "Not logged in"})
+            return
+
+        chat_name = data.get("name")
+        members = data.get("members", [])
+
+        if not chat_name:
+            self.send_response(client_socket, {"status": "error", "message": "Missing chat name"})
+            return
+
+        if keyword not in members:
+            members.append(keyword)
+
+        members = list(dict.fromkeys(members))
+        existing = get_existing_users(members)
+        invalid_members = [m for m in members if m not in existing]
+        if invalid_members:
+            self.send_response(client_socket, {"status": "error", "message": f"Invalid members: {invalid_members}"})
+            return
+
+        chat_id = create_chat(chat_name, members)
+        self.log(f"Chat created: {chat_name} by @{keyword}")
+        self.send_response(client_socket, {"status": "ok", "chat_id": chat_id})
+
+        self.push_chat_list_event(members, {"action": "chat_added", "chat": {"id": chat_id, "name": chat_name}})
+
+    def handle_add_users_to_chat(self, client_socket, data, username):
+        chat_id = data.get("chat_id")
+        new_members = data.get("users", [])
+
+        if not username or not chat_id:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        current_members = get_chat_members(chat_id)
+        if username not in current_members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        # Unknown keywords are reported per user in the results.
+        results = add_users_to_chat_bulk(chat_id, new_members)
+        added = [u for u, result in results.items() if result == "added"]
+        chat = get_chat(chat_id)
+        if added and chat:
+            self.push_chat_list_event(added, {"action": "chat_added", "chat": {"id": chat[0], "name": chat[1]}})
+
+        self.send_response(client_socket, {"status": "ok", "results": results})
+
+    def handle_leave_chat(self, client_socket, data, username):
+        chat_id = data.get("chat_id")
+        if not username or not chat_id:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        members = get_chat_members(chat_id)
+        if username not in members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        remove_user_from_chat(chat_id, username)
+        self.send_response(client_socket, {"status": "ok"})
+        self.push_chat_list_event([username], {"action": "chat_removed", "chat_id": chat_id})
+
+    def handle_delete_chat(self, client_socket, data, username):
+        chat_id = data.get("chat_id")
+        if not username or not chat_id:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        members = get_chat_members(chat_id)
+        if username not in members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        delete_chat(chat_id)
+        if self.purger:
+            self.purger.wake()
+        self.send_response(client_socket, {"status": "ok"})
+
+        self.push_chat_list_event(members, {"action": "chat_removed", "chat_id": chat_id})
+
+    def handle_rename_chat(self, client_socket, data, username):
+        chat_id = data.get("chat_id")
+        name = data.get("name")
+        if not username or not chat_id or not name:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        members = get_chat_members(chat_id)
+        if username not in members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        rename_chat(chat_id, name)
+        self.send_response(client_socket, {"status": "ok"})
+
+        self.push_chat_list_event(members, {"action": "chat_renamed", "chat_id": chat_id, "name": name})
+
+    def handle_get_chat_messages(self, client_socket, data, username):
+        chat_id = data.get("chat_id")
+        if not username or not chat_id:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        members = get_chat_members(chat_id)
+        if username not in members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        if any(key in data for key in ("before_id", "after_id", "limit")):
+            self.send_chat_messages_page(client_socket, chat_id, data)
+            return
+
+        messages = get_chat_messages(chat_id)
+        formatted = [{"from": sender, "message": msg} for sender, msg in messages]
+        self.send_response(client_socket, {"action": "chat_messages", "messages": formatted})
+
+    def send_chat_messages_page(self, client_socket, chat_id, data):
+        before_id = data.get("before_id")
+        after_id = data.get("after_id")
+        try:
+            limit = int(data.get("limit") or HISTORY_PAGE_SIZE)
+            before_id = int(before_id) if before_id is not None else None
+            after_id = int(after_id) if after_id is not None else None
+        except (TypeError, ValueError):
+            self.send_response(client_socket, {"status": "error", "message": "Invalid page cursor"})
+            return
+        limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+
+        rows, has_more = get_chat_messages_page(chat_id, before_id=before_id, after_id=after_id, limit=limit)
+        formatted = self.format_messages(rows)
+        next_cursor = None
+        if has_more and rows:
+            if after_id is not None:
+                next_cursor = {"after_id": rows[-1][0]}
+            else:
+                next_cursor = {"before_id": rows[0][0]}
+        self.send_response(client_socket, {
+            "action": "chat_messages",
+            "chat_id": chat_id,
+            "before_id": before_id,
+            "after_id": after_id,
+            "messages": formatted,
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        })
+
+    def handle_resume(self, client_socket, data, username):
+        # After a reconnect: for every chat the client lists with the last
+        # seq it saw, the messages after it. The whole reply holds at most
+        # RESUME_MAX_MESSAGES messages and RESUME_MAX_TEXT characters of
+        # text, so it always fits in a frame; chats with has_more (possibly
+        # with no messages, once the budget is spent) are continued with
+        # another resume from their new last seq. Chats the user is no
+        # longer in are left out.
+        chats = data.get("chats")
+        if not username or not isinstance(chats, dict):
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        results = []
+        rows_left = RESUME_MAX_MESSAGES
+        text_left = RESUME_MAX_TEXT
+        for chat_id, last_seq in list(chats.items())[:RESUME_MAX_CHATS]:
+            try:
+                last_seq = int(last_seq)
+            except (TypeError, ValueError):
+                continue
+            if username not in get_chat_members(chat_id):
+                continue
+            if rows_left <= 0 or text_left <= 0:
+                results.append({"chat_id": chat_id, "messages": [], "has_more": True})
+                continue
+            rows, has_more = get_messages_after_seq(chat_id, last_seq, min(rows_left, MAX_HISTORY_PAGE_SIZE))
+            for count, row in enumerate(rows):
+                size = len(row[1]) + len(row[2])
+                # The first message of the reply always goes, so every
+                # resume makes progress.
+                if size > text_left and rows_left < RESUME_MAX_MESSAGES:
+                    rows, has_more = rows[:count], True
+                    break
+                text_left -= size
+                rows_left -= 1
+            results.append({"chat_id": chat_id, "messages": self.format_messages(rows), "has_more": has_more})
+        self.send_response(client_socket, {"action": "resumed", "chats": results})
+
+    def handle_search_messages(self, client_socket, data, username):
+        query = (data.get("query") or "").strip()
+        chat_id = data.get("chat_id")
+        if not username or not query:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        if chat_id is not None and username not in get_chat_members(chat_id):
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        try:
+            limit = int(data.get("limit") or SEARCH_PAGE_SIZE)
+            offset = int(data.get("offset") or 0)
+        except (TypeError, ValueError):
+            self.send_response(client_socket, {"status": "error", "message": "Invalid page cursor"})
+            return
+        limit = max(1, min(limit, MAX_SEARCH_PAGE_SIZE))
+        offset = max(0, offset)
+
+        rows, has_more = search_messages(username, query, chat_id=chat_id, limit=limit, offset=offset)
+        results = [
+            {"id": mid, "chat_id": cid, "from": sender, "message": msg, "timestamp": ts, "snippet": snippet}
+            for mid, cid, sender, msg, ts, snippet in rows
+        ]
+        self.send_response(client_socket, {
+            "action": "search_results",
+            "query": query,
+            "chat_id": chat_id,
+            "offset": offset,
+            "results": results,
+            "has_more": has_more,
+            "next_offset": offset + len(results) if has_more else None
+        })
+
+    def handle_set_retention(self, client_socket, data, username):
+        chat_id = data.get("chat_id")
+        if not username or not chat_id:
+            self.send_response(client_socket, {"status": "error", "message": "Missing fields"})
+            return
+
+        members = get_chat_members(chat_id)
+        if username not in members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        # Missing or null limits fall back to the server-wide policy.
+        try:
+            max_age_days = data.get("max_age_days")
+            max_messages = data.get("max_messages")
+            max_age_days = max(0, int(max_age_days)) if max_age_days is not None else None
+            max_messages = max(0, int(max_messages)) if max_messages is not None else None
+        except (TypeError, ValueError):
+            self.send_response(client_socket, {"status": "error", "message": "Invalid retention limits"})
+            return
+
+        set_retention_policy(chat_id, max_age_days, max_messages)
+        max_age_days, max_messages = get_retention_policy(chat_id)
+        self.log(f"Retention for chat {chat_id} set by @{username}: {max_age_days} days, {max_messages} messages")
+        self.send_response(client_socket, {
+            "status": "ok", "chat_id": chat_id, "max_age_days": max_age_days, "max_messages": max_messages
+        })
+
+    def handle_profile(self, client_socket, data, username):
+        if username not in ADMIN_KEYWORDS:
+            self.send_response(client_socket, {"status": "error", "message": "Not allowed"})
+            return
+
+        command = data.get("command", "status")
+        reports = []
+        if command == "start":
+            try:
+                duration = float(data.get("duration") or PROFILE_DEFAULT_SECONDS)
+            except (TypeError, ValueError):
+                self.send_response(client_socket, {"status": "error", "message": "Invalid duration"})
+                return
+            if not self.profiler.start(duration, trace_memory=bool(data.get("memory"))):
+                self.send_response(client_socket, {"status": "error", "message": "Already profiling"})
+                return
+        elif command == "stop":
+            reports = self.profiler.stop()
+        elif command != "status":
+            self.send_response(client_socket, {"status": "error", "message": "Unknown profile command"})
+            return
+        self.send_response(client_socket, dict(self.profiler.status(), status="ok", reports=reports))
+
+    def handle_watch_chat(self, client_socket, data, username):
+        # The chat on screen; presence updates come only for it. A null
+        # chat_id stops them.
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            self.presence.unwatch(client_socket)
+            return
+        if not username:
+            self.send_response(client_socket, {"status": "error", "message": "Not logged in"})
+            return
+
+        members = get_chat_members(chat_id)
+        if username not in members:
+            self.send_response(client_socket, {"status": "error", "message": "You are not in this chat"})
+            return
+
+        state = self.presence.watch(client_socket, chat_id, members)
+        self.send_response(client_socket, dict(state, action="presence", chat_id=chat_id, snapshot=True))
+
+    def handle_typing(self, client_socket, data, username):
+        # Fire and forget: no reply, and events over the rate limit or for
+        # chats the user is not in are ignored.
+        chat_id = data.get("chat_id")
+        if not username or not chat_id or username not in get_chat_members(chat_id):
+            return
+        if self.presence.typing_started(client_socket, chat_id, username) and self.cluster:
+            self.cluster.typing(chat_id, username, True)
+
+    # ========================
+    #    SUPPORT FUNCTIONS
+    # ========================
+
+    def format_messages(self, rows):
+        return [
+            {"id": mid, "seq": seq, "from": sender, "message": msg, "timestamp": ts}
+            for mid, sender, msg, ts, seq in rows
+        ]
+
+    def send_response(self, client_socket, response_dict):
+        context = self.request_context
+        if getattr(context, "conn", None) is client_socket and context.request_id is not None:
+            response_dict = dict(response_dict, request_id=context.request_id)
+        client_socket.send(encode_frame(response_dict, client_socket.codec))
+
+    def broadcast_to_chat(self, chat_id, response_dict, members=None):
+        if members is None:
+            members = get_chat_members(chat_id)
+        self.deliver_to_members(members, response_dict)
+        if self.cluster:
+            self.cluster.deliver(members, response_dict)
+
+    def deliver_to_members(self, members, response_dict):
+        # Local connections only; other shards deliver to their own.
+        started = time.perf_counter()
+        frames = {}  # encoded once per codec in use
+        connections = self.sessions.connections_for_members(members)
+        for sock in connections:
+            data = frames.get(sock.codec)
+            if data is None:
+                data = frames[sock.codec] = encode_frame(response_dict, sock.codec)
+            sock.send(data)
+        metrics.observe("broadcast.fanout", len(connections), SIZE_BUCKETS)
+        metrics.observe("broadcast.duration", (time.perf_counter() - started) * 1000)
+
+    def push_chat_list_event(self, keywords, event):
+        # Each delta carries the next version, so none may be lost.
+        # In a cluster the hub numbers them and sends them back to every
+        # shard the user is connected to, this one included.
+        if self.cluster:
+            self.cluster.push_chat_list_event(keywords, event)
+            return
+        for keyword in keywords:
+            self.chat_list_versions.push(
+                keyword,
+                self.sessions.connections_for(keyword),
+                lambda conn, version: encode_frame(dict(event, version=version), conn.codec)
+            )
+
+    def deliver_chat_list_event(self, keyword, version, event):
+        for conn in self.sessions.connections_for(keyword):
+            conn.send(encode_frame(dict(event, version=version), conn.codec))
+
+    def outbound_stats(self):
+        depths = [client.outbound.depth() for client in list(self.clients)]
+        stats = self.outbound_metrics.snapshot()
+        stats.update({
+            "connections": len(depths),
+            "queued_frames": sum(frames for frames, _ in depths),
+            "queued_bytes": sum(size for _, size in depths),
+            "max_queued_bytes": max((size for _, size in depths), default=0),
+        })
+        return stats
+
+    def stats(self):
+        # Everything the metrics endpoint and dump file report.
+        snapshot = metrics.snapshot()
+        snapshot.update({
+            "sessions": self.sessions.stats(),
+            "outbound": self.outbound_stats(),
+            "message_writer": self.message_writer.stats(),
+            "membership_cache": membership_cache.stats(),
+            "presence": self.presence.stats(),
+            "db_pool": pool_stats(),
+        })
+        if self.retention:
+            snapshot["retention"] = self.retention.stats()
+        if self.purger:
+            snapshot["purge"] = self.purger.stats()
+        return snapshot
+
+    def start_metrics(self):
+        try:
+            if self.metrics_port is not None and not self.metrics_http:
+                self.metrics_http = MetricsHttpServer(self.stats, port=self.metrics_port)
+                self.metrics_http.start()
+                self.log(f"Metrics on http://127.0.0.1:{self.metrics_http.port}/metrics")
+            if self.metrics_file and not self.metrics_dumper:
+                self.metrics_dumper = MetricsFileDumper(self.stats, self.metrics_file, METRICS_INTERVAL, self.log)
+                self.metrics_dumper.start()
+        except OSError as e:
+            self.metrics_http = None
+            self.log(f"Metrics endpoint disabled: {e}")
+
+    def stop_metrics(self):
+        if self.metrics_http:
+            self.metrics_http.stop()
+            self.metrics_http = None
+        if self.metrics_dumper:
+            self.metrics_dumper.stop()
+            self.metrics_dumper = None
+
+    def get_or_create_default_chat(self, name):
+        chat_id = get_chat_by_name(name)
+        if chat_id:
+            return chat_id
+        return create_chat(name, [])
+
@@ -0,0 +1,84 @@
+import threading
+from collections import deque
+
+
+class SessionRegistry:
+    # Logged-in connections, indexed both ways: connection -> keyword and
+    # keyword -> set of connections (one user may be logged in from several
+    # devices). All updates happen under one lock, so login and logout are
+    # atomic with respect to broadcasts reading the index.
+    # on_presence(keyword, online) is called when a user's first connection
+    # logs in and when their last one goes away. It runs after the lock is
+    # released (the hook may block, and may need the index itself), in the
+    # order the changes happened.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_connection = {}
+        self.by_keyword = {}
+        self.on_presence = None
+        self.presence_changes = deque()  # (keyword, online) not yet reported
+        self.notify_lock = threading.Lock()
+
+    def login(self, conn, keyword):
+        with self.lock:
+            self._remove(conn)
+            self.by_connection[conn] = keyword
+            conns = self.by_keyword.setdefault(keyword, set())
+            conns.add(conn)
+            if len(conns) == 1:
+                self.presence_changes.append((keyword, True))
+        self._notify_presence()
+
+    def logout(self, conn):
+        with self.lock:
+            keyword = self._remove(conn)
+        self._notify_presence()
+        return keyword
+
+    def _remove(self, conn):
+        keyword = self.by_connection.pop(conn, None)
+        if keyword is not None:
+            conns = self.by_keyword.get(keyword)
+            if conns is not None:
+                conns.discard(conn)
+                if not conns:
+                    del self.by_keyword[keyword]
+                    self.presence_changes.append((keyword, False))
+        return keyword
+
+    def _notify_presence(self):
+        # Changes are queued under the lock and reported one at a time under
+        # notify_lock, so a quick logout/login never reaches the hook
+        # reordered.
+        with self.notify_lock:
+            while True:
+                with self.lock:
+                    if not self.presence_changes:
+                        return
+                    keyword, online = self.presence_changes.popleft()
+                if self.on_presence:
+                    self.on_presence(keyword, online)
+
+    def get(self, conn):
+        return self.by_connection.get(conn)
+
+    def connections_for(self, keyword):
+        with self.lock:
+            return tuple(self.by_keyword.get(keyword, ()))
+
+    def connections_for_members(self, keywords):
+        # Cost is O(len(keywords)), independent of how many users are online.
+        with self.lock:
+            found = []
+            for keyword in keywords:
+                conns = self.by_keyword.get(keyword)
+                if conns:
+                    found.extend(conns)
+            return found
+
+    def is_online(self, keyword):
+        return keyword in self.by_keyword
+
+    def stats(self):
+        with self.lock:
+            return {"connections": len(self.by_connection), "users": len(self.by_keyword)}
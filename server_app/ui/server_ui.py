@@ -6,7 +6,6 @@ class ServerUI(QWidget):
         super().__init__()
         self.setWindowTitle("Messenger Server")
         self.setGeometry(100, 100, 500, 400)
-        self.server_running = False  # Track server state
         self.setup_ui()
 
     def setup_ui(self):
@@ -21,7 +20,6 @@ class ServerUI(QWidget):
         layout.addWidget(self.log_area)
 
         self.start_button = QPushButton("Start Server")
-        self.start_button.clicked.connect(self.toggle_server)  # Toggle function
         layout.addWidget(self.start_button)
 
         self.setLayout(layout)
@@ -32,18 +30,10 @@ class ServerUI(QWidget):
     def update_status(self, status):
         self.status_label.setText(f"Server Status: {status}")
 
-    def toggle_server(self):
-        if self.server_running:
-            self.stop_server()
+    def set_running(self, running):
+        if running:
+            self.update_status("Running")
+            self.start_button.setText("Stop Server")
         else:
-            self.start_server()
-
-    def start_server(self):
-        self.server_running = True
-        self.update_status("Running")
-        self.start_button.setText("Stop Server")
-
-    def stop_server(self):
-        self.server_running = False
-        self.update_status("Stopped")
-        self.start_button.setText("Start Server")
+            self.update_status("Stopped")
+            self.start_button.setText("Start Server")
@@ -0,0 +1,246 @@
+import json
+import struct
+from shared.config import ENCODING
+
+# Payload codecs. JSON is always available; "msgpack" is a pure-Python
+# MessagePack subset (nil, bool, int, float, str, bin, array, map) that is
+# negotiated per connection with a "hello" exchange. Decoding never needs
+# the negotiated codec: every protocol message is a map, which JSON starts
+# with "{" (0x7b) and MessagePack with a map marker (0x80-0x8f, 0xde, 0xdf).
+# Anything else, including a map with non-string keys or a length running
+# past the end of the payload, is a CodecError (a ValueError).
+
+
+class CodecError(ValueError):
+    pass
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message):
+        return json.dumps(message).encode(ENCODING)
+
+    def decode(self, payload):
+        return json.loads(payload.decode(ENCODING))
+
+
+_pack_u8 = struct.Struct("!B").pack
+_pack_u16 = struct.Struct("!H").pack
+_pack_u32 = struct.Struct("!I").pack
+_pack_u64 = struct.Struct("!Q").pack
+_pack_i8 = struct.Struct("!b").pack
+_pack_i16 = struct.Struct("!h").pack
+_pack_i32 = struct.Struct("!i").pack
+_pack_i64 = struct.Struct("!q").pack
+_pack_f64 = struct.Struct("!d").pack
+_unpack_from = struct.unpack_from
+
+
+class MsgPackCodec:
+    name = "msgpack"
+
+    def encode(self, message):
+        out = []
+        self._pack(message, out.append)
+        return b"".join(out)
+
+    def _pack(self, obj, write):
+        if obj is None:
+            write(b"\xc0")
+        elif obj is True:
+            write(b"\xc3")
+        elif obj is False:
+            write(b"\xc2")
+        elif isinstance(obj, str):
+            data = obj.encode(ENCODING)
+            n = len(data)
+            if n < 32:
+                write(_pack_u8(0xa0 | n))
+            elif n < 0x100:
+                write(b"\xd9" + _pack_u8(n))
+            elif n < 0x10000:
+                write(b"\xda" + _pack_u16(n))
+            else:
+                write(b"\xdb" + _pack_u32(n))
+            write(data)
+        elif isinstance(obj, int):
+            if 0 <= obj < 0x80:
+                write(_pack_u8(obj))
+            elif -32 <= obj < 0:
+                write(_pack_i8(obj))
+            elif 0 <= obj < 0x100:
+                write(b"\xcc" + _pack_u8(obj))
+            elif 0 <= obj < 0x10000:
+                write(b"\xcd" + _pack_u16(obj))
+            elif 0 <= obj < 0x100000000:
+                write(b"\xce" + _pack_u32(obj))
+            elif 0 <= obj < 0x10000000000000000:
+                write(b"\xcf" + _pack_u64(obj))
+            elif -0x80 <= obj:
+                write(b"\xd0" + _pack_i8(obj))
+            elif -0x8000 <= obj:
+                write(b"\xd1" + _pack_i16(obj))
+            elif -0x80000000 <= obj:
+                write(b"\xd2" + _pack_i32(obj))
+            elif -0x8000000000000000 <= obj:
+                write(b"\xd3" + _pack_i64(obj))
+            else:
+                raise CodecError(f"Integer out of range: {obj}")
+        elif isinstance(obj, float):
+            write(b"\xcb" + _pack_f64(obj))
+        elif isinstance(obj, dict):
+            n = len(obj)
+            if n < 16:
+                write(_pack_u8(0x80 | n))
+            elif n < 0x10000:
+                write(b"\xde" + _pack_u16(n))
+            else:
+                write(b"\xdf" + _pack_u32(n))
+            for key, value in obj.items():
+                self._pack(key, write)
+                self._pack(value, write)
+        elif isinstance(obj, (list, tuple)):
+            n = len(obj)
+            if n < 16:
+                write(_pack_u8(0x90 | n))
+            elif n < 0x10000:
+                write(b"\xdc" + _pack_u16(n))
+            else:
+                write(b"\xdd" + _pack_u32(n))
+            for item in obj:
+                self._pack(item, write)
+        elif isinstance(obj, (bytes, bytearray)):
+            n = len(obj)
+            if n < 0x100:
+                write(b"\xc4" + _pack_u8(n))
+            elif n < 0x10000:
+                write(b"\xc5" + _pack_u16(n))
+            else:
+                write(b"\xc6" + _pack_u32(n))
+            write(bytes(obj))
+        else:
+            raise CodecError(f"Cannot encode {type(obj).__name__}")
+
+    def decode(self, payload):
+        try:
+            obj, offset = self._unpack(payload, 0)
+        except (IndexError, struct.error, UnicodeDecodeError, RecursionError) as e:
+            raise CodecError(f"Malformed msgpack payload: {e}")
+        if offset != len(payload):
+            raise CodecError("Trailing bytes after msgpack payload")
+        if not isinstance(obj, dict):
+            raise CodecError("Message is not a map")
+        return obj
+
+    def _unpack(self, data, i):
+        b = data[i]
+        i += 1
+        if b < 0x80:
+            return b, i
+        if b >= 0xe0:
+            return b - 0x100, i
+        if 0xa0 <= b <= 0xbf:
+            n = b & 0x1f
+            return self._unpack_raw(data, i, n).decode(ENCODING), i + n
+        if 0x80 <= b <= 0x8f:
+            return self._unpack_map(data, i, b & 0x0f)
+        if 0x90 <= b <= 0x9f:
+            return self._unpack_array(data, i, b & 0x0f)
+        if b == 0xc0:
+            return None, i
+        if b == 0xc2:
+            return False, i
+        if b == 0xc3:
+            return True, i
+        if b == 0xcc:
+            return data[i], i + 1
+        if b == 0xcd:
+            return _unpack_from("!H", data, i)[0], i + 2
+        if b == 0xce:
+            return _unpack_from("!I", data, i)[0], i + 4
+        if b == 0xcf:
+            return _unpack_from("!Q", data, i)[0], i + 8
+        if b == 0xd0:
+            return _unpack_from("!b", data, i)[0], i + 1
+        if b == 0xd1:
+            return _unpack_from("!h", data, i)[0], i + 2
+        if b == 0xd2:
+            return _unpack_from("!i", data, i)[0], i + 4
+        if b == 0xd3:
+            return _unpack_from("!q", data, i)[0], i + 8
+        if b == 0xca:
+            return _unpack_from("!f", data, i)[0], i + 4
+        if b == 0xcb:
+            return _unpack_from("!d", data, i)[0], i + 8
+        if b in (0xd9, 0xda, 0xdb, 0xc4, 0xc5, 0xc6):
+            size = {0xd9: 1, 0xc4: 1, 0xda: 2, 0xc5: 2, 0xdb: 4, 0xc6: 4}[b]
+            n = int.from_bytes(self._unpack_raw(data, i, size), "big")
+            i += size
+            chunk = self._unpack_raw(data, i, n)
+            if b >= 0xd9:
+                return chunk.decode(ENCODING), i + n
+            return bytes(chunk), i + n
+        if b == 0xdc:
+            return self._unpack_array(data, i + 2, _unpack_from("!H", data, i)[0])
+        if b == 0xdd:
+            return self._unpack_array(data, i + 4, _unpack_from("!I", data, i)[0])
+        if b == 0xde:
+            return self._unpack_map(data, i + 2, _unpack_from("!H", data, i)[0])
+        if b == 0xdf:
+            return self._unpack_map(data, i + 4, _unpack_from("!I", data, i)[0])
+        raise CodecError(f"Unsupported msgpack type byte 0x{b:02x}")
+
+    def _unpack_raw(self, data, i, n):
+        chunk = data[i:i + n]
+        if len(chunk) != n:
+            raise IndexError("truncated str or bin")
+        return chunk
+
+    def _unpack_array(self, data, i, n):
+        items = []
+        for _ in range(n):
+            item, i = self._unpack(data, i)
+            items.append(item)
+        return items, i
+
+    def _unpack_map(self, data, i, n):
+        result = {}
+        for _ in range(n):
+            key, i = self._unpack(data, i)
+            if not isinstance(key, str):
+                raise CodecError(f"Map key is {type(key).__name__}, not str")
+            value, i = self._unpack(data, i)
+            result[key] = value
+        return result, i
+
+
+JSON = JsonCodec()
+MSGPACK = MsgPackCodec()
+CODECS = {codec.name: codec for codec in (MSGPACK, JSON)}
+# Order of preference when the peer offers several codecs.
+SUPPORTED_CODECS = [MSGPACK.name, JSON.name]
+
+
+def negotiate(offered):
+    # offered is the client's list of codec names; a client that offers
+    # none gets JSON.
+    if offered is None:
+        return JSON
+    if not isinstance(offered, list) or not all(isinstance(name, str) for name in offered):
+        raise CodecError("codecs must be a list of strings")
+    for name in SUPPORTED_CODECS:
+        if name in offered:
+            return CODECS[name]
+    return JSON
+
+
+def decode_any(payload):
+    if not payload:
+        raise CodecError("Empty payload")
+    if payload[0] == 0x7b:  # "{"
+        try:
+            return JSON.decode(payload)
+        except (ValueError, RecursionError) as e:
+            raise CodecError(f"Malformed JSON payload: {e}")
+    return MSGPACK.decode(payload)
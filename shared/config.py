@@ -1,5 +1,52 @@
+import os
+
 DB_NAME = "messenger.db"
 HOST = '127.0.0.1'
 PORT = 65432
 BUFFER_SIZE = 4096
-ENCODING = 'utf-8'
\ No newline at end of file
+ENCODING = 'utf-8'
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+SERVER_ENGINE = 'asyncio'  # 'asyncio' or 'threaded'
+DB_WORKERS = 32
+CLUSTER_WORKERS = 1  # >1 runs that many server processes on one port (Linux/BSD)
+CLUSTER_CALL_TIMEOUT = 5  # seconds a shard waits for the hub to answer
+DB_SYNCHRONOUS = 'NORMAL'  # safe with WAL: only the last commits can be lost on power failure
+DB_WRITER_SYNCHRONOUS = 'FULL'  # message writer: a message is on disk before it is acked; one fsync per batch
+DB_CACHE_SIZE_KB = 16 * 1024
+DB_STATEMENT_CACHE_SIZE = 256
+DB_BUSY_TIMEOUT_MS = 5000
+WRITE_BATCH_SIZE = 32
+WRITE_BATCH_LATENCY = 0.001  # seconds the writer waits to fill a batch
+WRITE_TIMEOUT = 10  # seconds send_message waits for its message to be committed
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+RESUME_MAX_CHATS = 200  # chats a client may catch up on in one resume request
+RESUME_MAX_MESSAGES = 1000  # messages in one resume reply, across all its chats
+RESUME_MAX_TEXT = 1024 * 1024  # characters of message text in one resume reply (JSON spends up to 12 bytes on one)
+MEMBERSHIP_CACHE_SIZE = 10000  # chats kept in the server-side membership cache
+OUTBOUND_MAX_BYTES = 4 * 1024 * 1024  # per-connection send buffer
+SLOW_CONSUMER_POLICY = 'disconnect'  # 'drop' or 'disconnect'
+PRESENCE_FLUSH_INTERVAL = 0.25  # seconds over which presence/typing changes are coalesced per chat
+TYPING_TIMEOUT = 5  # seconds a typing indicator lasts without a refresh
+TYPING_MIN_INTERVAL = 2  # seconds between typing events a client sends while typing
+METRICS_PORT = None  # localhost port for GET /metrics (0 picks a free one); None disables
+METRICS_FILE = None  # append a JSON snapshot to this file every METRICS_INTERVAL seconds
+METRICS_INTERVAL = 10
+ADMIN_KEYWORDS = []  # users allowed to run admin actions (profiling)
+PROFILE_DIR = 'profiles'
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_TRACEMALLOC_FRAMES = 10
+RETENTION_MAX_AGE_DAYS = None  # global policy; None keeps messages forever
+RETENTION_MAX_MESSAGES = None  # newest messages kept per chat; None keeps all
+RETENTION_INTERVAL = 24 * 3600  # seconds between retention passes
+RETENTION_BATCH = 500  # messages archived per transaction
+RETENTION_PAUSE = 0.05  # seconds between batches, so live writes get the lock
+RETENTION_VACUUM_PAGES = 256  # pages freed per incremental vacuum step
+PURGE_BATCH = 500  # messages of a deleted chat removed per transaction
+PURGE_PAUSE = 0.02  # seconds between purge batches
+PURGE_INTERVAL = 60  # seconds between checks for unfinished purges
+ARCHIVE_DIR = 'archive'  # next to the database file
+REQUEST_TIMEOUT = 15  # seconds the client waits for a reply before giving up on a request
+CLIENT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.messenger_cache')
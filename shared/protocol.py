@@ -0,0 +1,69 @@
+import struct
+from shared.config import MAX_FRAME_SIZE
+from shared.codec import JSON, decode_any
+
+# Every message on the wire is a 4-byte big-endian length followed by
+# that many bytes of payload, encoded with the connection's codec.
+HEADER = struct.Struct("!I")
+
+_constant_frames = {}
+
+
+class FrameError(ValueError):
+    pass
+
+
+def encode_frame(message, codec=JSON, max_size=MAX_FRAME_SIZE):
+    return pack_payload(codec.encode(message), max_size)
+
+
+def constant_frame(name, message, codec=JSON):
+    # Frames whose content never changes are encoded once per codec.
+    key = (name, codec.name)
+    frame = _constant_frames.get(key)
+    if frame is None:
+        frame = _constant_frames[key] = encode_frame(message, codec)
+    return frame
+
+
+def pack_payload(payload, max_size=MAX_FRAME_SIZE):
+    if len(payload) > max_size:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds limit of {max_size}")
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode_payload(payload):
+    return decode_any(payload)
+
+
+def send_frame(sock, message, codec=JSON):
+    sock.sendall(encode_frame(message, codec))
+
+
+class FrameDecoder:
+    def __init__(self, max_size=MAX_FRAME_SIZE):
+        self.max_size = max_size
+        self.buffer = bytearray()
+
+    def feed_payloads(self, data):
+        self.buffer += data
+        payloads = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_size:
+                raise FrameError(f"Frame of {length} bytes exceeds limit of {self.max_size}")
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            payloads.append(bytes(self.buffer[offset + HEADER.size:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return payloads
+
+    def feed(self, data):
+        return [decode_payload(payload) for payload in self.feed_payloads(data)]
+
+    def pending_bytes(self):
+        return len(self.buffer)
@@ -0,0 +1,11 @@
+import pytest
+from server_app import python_db
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A fresh database (and archive directory) per test.
+    python_db.set_database(str(tmp_path / "messenger.db"))
+    python_db.init_db()
+    yield python_db
+    python_db.pool.close_all()
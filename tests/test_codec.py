@@ -0,0 +1,34 @@
+import pytest
+from shared.codec import MSGPACK, CodecError, decode_any, negotiate
+
+
+def test_msgpack_round_trip():
+    message = {"action": "send_message", "chat_id": "c", "seq": 70000, "ids": [1, -5, None], "ok": True}
+    assert decode_any(MSGPACK.encode(message)) == message
+
+
+@pytest.mark.parametrize("payload", [
+    b"\x92\x01\x02",         # array root
+    b"\xa3abc",              # str root
+    b"\x81\x01\x02",         # int key
+    b"\x81\x91\x01\x02",     # unhashable key
+    b"\x81\xa5ab",           # fixstr longer than the payload
+    b"\x81\xd9\x10abc",      # str8 longer than the payload
+    b"\x81\xa1a\xc5\x00",    # bin16 length cut short
+    b"\x81\xa1a\xc1",        # unsupported type byte
+    b"\x80\x00",             # trailing bytes
+    b"{not json",
+    b"",
+])
+def test_malformed_payloads_raise_codec_error(payload):
+    with pytest.raises(CodecError):
+        decode_any(payload)
+
+
+def test_negotiate_requires_a_list_of_names():
+    assert negotiate(None).name == "json"
+    assert negotiate(["json", "msgpack"]).name == "msgpack"
+    assert negotiate(["xml"]).name == "json"
+    for offered in ("msgpack", ["msgpack", 1], {"msgpack": 1}):
+        with pytest.raises(CodecError):
+            negotiate(offered)
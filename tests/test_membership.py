@@ -0,0 +1,9 @@
+def test_bulk_add_reports_each_user(db):
+    for keyword in ("owner", "alice", "bob"):
+        db.add_user(keyword, keyword, "pw")
+    chat_id = db.create_chat("cohort", ["owner", "alice"])
+
+    results = db.add_users_to_chat_bulk(chat_id, ["alice", "bob", "ghost", "bob"])
+
+    assert results == {"alice": "already_member", "bob": "added", "ghost": "unknown_user"}
+    assert db.get_chat_members(chat_id) == {"owner", "alice", "bob"}
@@ -0,0 +1,52 @@
+import pytest
+
+# The statements python_db runs on hot paths, each with the index it must
+# be answered from. Re-run after schema changes; a query that falls back to
+# scanning messages or chat_members fails here instead of in production.
+HOT_QUERIES = {
+    "get_user": ("GET_USER_SQL", ("user",), "sqlite_autoindex_users_1"),
+    "get_chat_by_name": ("CHAT_BY_NAME_SQL", ("Group Chat",), "idx_chats_name"),
+    "get_user_chats": ("USER_CHATS_SQL", ("user",), "idx_chat_members_keyword"),
+    "get_chat_members": ("CHAT_MEMBERS_SQL", ("chat",), "sqlite_autoindex_chat_members_1"),
+    "find_client_message": ("FIND_CLIENT_MESSAGE_SQL", ("chat", "user", "abc"), "idx_messages_client_id"),
+    "get_chat_messages": ("CHAT_MESSAGES_SQL", ("chat",), "idx_messages_chat_id"),
+    "get_chat_messages_page (after)": ("MESSAGES_AFTER_SQL", ("chat", 100, 50), "idx_messages_chat_id"),
+    "get_chat_messages_page (before)": ("MESSAGES_BEFORE_SQL", ("chat", 100, 50), "idx_messages_chat_id"),
+    "get_chat_messages_page (latest)": ("LATEST_MESSAGES_SQL", ("chat", 50), "idx_messages_chat_id"),
+    "get_messages_after_seq": ("MESSAGES_AFTER_SEQ_SQL", ("chat", 100, 500), "idx_messages_chat_seq"),
+    "archived_messages (after)": ("SEGMENTS_AFTER_SQL", ("chat", 100), "idx_archive_segments_chat"),
+    "archived_messages (before)": ("SEGMENTS_BEFORE_SQL", ("chat", 100), "idx_archive_segments_chat"),
+    "expiry_boundary (age)": ("EXPIRY_BY_AGE_SQL", ("chat", "2024-01-01 00:00:00"), "idx_messages_chat_id"),
+    "expiry_boundary (count)": ("EXPIRY_BY_COUNT_SQL", ("chat", 999), "idx_messages_chat_id"),
+    "expiry_boundary (next id)": ("NEXT_MESSAGE_ID_SQL", ("chat",), "idx_messages_chat_id"),
+    "archive_oldest_messages": ("OLDEST_MESSAGES_SQL", ("chat", 100, 500), "idx_messages_chat_id"),
+    "archive_oldest_messages (delete)": ("DELETE_ARCHIVED_SQL", ("chat", 1, 100), "idx_messages_chat_id"),
+    "purge_deleted_chat": ("PURGE_MESSAGES_SQL", ("chat", 500), "idx_messages_chat_id"),
+    "search_messages": ("SEARCH_SQL", ("user", '"hello"*', 21, 0), "sqlite_autoindex_chat_members_1"),
+    "search_messages (in chat)": (
+        "SEARCH_IN_CHAT_SQL", ("user", '"hello"*', "chat", 21, 0), "sqlite_autoindex_chat_members_1"),
+}
+
+# Sorts that are expected. Search results are ranked by bm25, which only
+# exists per match, so the matches are always sorted; the full-text index
+# bounds how many there are. Forward archive reads sort the chat's segment
+# rows (one per month and retention batch) by first_id.
+SORT_ALLOWED = {"search_messages", "search_messages (in chat)", "archived_messages (after)"}
+
+
+def query_plan(db, sql, params):
+    conn = db.pool.connection()
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_its_index(db, name):
+    constant, params, index = HOT_QUERIES[name]
+    plan = query_plan(db, getattr(db, constant), params)
+
+    # The FTS5 table is read through its own full-text index.
+    scans = [step for step in plan if step.startswith("SCAN") and "VIRTUAL TABLE INDEX" not in step]
+    assert not scans, plan
+    assert any(f"INDEX {index} " in step for step in plan), plan
+    if name not in SORT_ALLOWED:
+        assert not any("TEMP B-TREE" in step for step in plan), plan
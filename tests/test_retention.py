@@ -0,0 +1,48 @@
+import errno
+import time
+from server_app import archive
+from server_app.retention import RetentionWorker
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def live_messages(db, chat_id):
+    conn = db.pool.connection()
+    return conn.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+
+def test_archive_write_failure_is_retried(db, monkeypatch):
+    db.add_user("alice", "alice", "pw")
+    chat_id = db.create_chat("old", ["alice"])
+    for i in range(20):
+        db.add_message(chat_id, "alice", f"message {i}")
+    db.set_retention_policy(chat_id, None, 5)
+
+    attempts = []
+
+    def disk_full(path, rows):
+        attempts.append(path)
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(archive, "write_segment", disk_full)
+    logs = []
+    worker = RetentionWorker(logs.append, interval=0.01, pause=0)
+    worker.start()
+    try:
+        # The thread survives the failure and keeps trying.
+        assert wait_until(lambda: len(attempts) >= 2)
+        assert live_messages(db, chat_id) == 20
+        monkeypatch.undo()
+        assert wait_until(lambda: live_messages(db, chat_id) == 5)
+    finally:
+        worker.stop()
+    assert any("No space left on device" in line for line in logs)
+    page, _ = db.get_chat_messages_page(chat_id, limit=50)
+    assert [row[2] for row in page] == [f"message {i}" for i in range(20)]